@@ -0,0 +1,107 @@
+import asyncio
+import json
+import sys
+import time
+
+sys.path.append("/home/aukiozgq/order_puller/")
+from src.connectors.cache_connector import CacheConnector
+from src.connectors.config_connector import ConfigConnector
+from src.logging.logger import get_module_logger
+from src.puller import main
+from src.sync.fingerprint import check_run
+
+logger = get_module_logger(__name__)
+
+DAEMON_STATUS_CACHE = "daemon_status.json"
+
+
+class PullerDaemon:
+    """
+    Keeps the puller resident and runs it every `daemon_interval_minutes`.
+    Being a single process, the Woo catalogue snapshot, SKU whitelist,
+    parsed sources and config stay warm in memory between runs.
+    A run that is still going when the next one is due makes that one skip.
+    The last run timings are written to the cache folder and, when
+    `daemon_status_port` is set, served as JSON on localhost.
+    """
+
+    def __init__(self):
+        self.run_lock = asyncio.Lock()
+        self.run_tasks = set()
+        self.cache_connector = CacheConnector()
+        self.status = {
+            "runs": 0,
+            "skipped": 0,
+            "overlaps": 0,
+            "last_run": None,
+        }
+
+    async def serve(self):
+        config = ConfigConnector().get_config()
+        status_port = config.get("daemon_status_port")
+        if status_port:
+            await asyncio.start_server(
+                self._send_status, host="127.0.0.1", port=status_port
+            )
+            logger.info(
+                msg=f"Serving the daemon status on port {status_port}."
+            )
+
+        while True:
+            config = ConfigConnector().get_config()
+            interval = config.get("daemon_interval_minutes", 10) * 60
+            # Keep a reference, a task nobody references can be collected
+            # before it finishes.
+            run_task = asyncio.create_task(self.run_once())
+            self.run_tasks.add(run_task)
+            run_task.add_done_callback(self._on_run_done)
+            await asyncio.sleep(interval)
+
+    async def run_once(self):
+        if self.run_lock.locked():
+            logger.warning(
+                msg="Previous run is still going, skipping this one."
+            )
+            self.status["overlaps"] += 1
+            return
+        async with self.run_lock:
+            config = ConfigConnector().get_config()
+            skip, run_fingerprint = await asyncio.to_thread(
+                check_run, config=config, cache_connector=self.cache_connector
+            )
+            if skip:
+                logger.info(
+                    msg="Nothing changed since the last run. Skipping."
+                )
+                self.status["skipped"] += 1
+            else:
+                self.status["last_run"] = await main(
+                    run_fingerprint=run_fingerprint
+                )
+                self.status["runs"] += 1
+            self.status["checked_at"] = time.time()
+            self.cache_connector.set_json(DAEMON_STATUS_CACHE, self.status)
+
+    def _on_run_done(self, task):
+        self.run_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(
+                msg=f"Unexpected error in a daemon run. \n"
+                f"Error: {task.exception()!r}"
+            )
+
+    async def _send_status(self, reader, writer):
+        await reader.readline()
+        body = json.dumps(self.status).encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode("utf-8")
+            + body
+        )
+        await writer.drain()
+        writer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(PullerDaemon().serve())
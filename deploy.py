@@ -1,10 +1,16 @@
+import hashlib
+import json
 import os
 import os.path
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from ftplib import FTP, error_perm
+from io import BytesIO
 
 from src.settings import Config
 
 IGNORE = [
+    ".DS_Store",
     ".idea",
     ".git",
     ".github",
@@ -14,33 +20,138 @@ IGNORE = [
     "README.md",
     # "config.json",
     "requirements.local.txt",
+    "cache",
     "tmp",
     "tmp_old",
 ]
+MANIFEST_FILE = ".deploy_manifest.json"
+UPLOAD_SUFFIX = ".deploying"
+SESSIONS = int(os.getenv("DEPLOY_SESSIONS", 4))
 
 
-def store_file(session, path):
-    for name in os.listdir(path):
-        if name not in IGNORE:
-            localpath = os.path.join(path, name)
-            if os.path.isfile(localpath):
-                with open(localpath, "rb") as file:
-                    session.storbinary("STOR {}".format(name), file)
-            elif os.path.isdir(localpath):
-                try:
-                    session.mkd(name)
-                # ignore "directory already exists"
-                except error_perm as e:
-                    if not e.args[0].startswith("550"):
-                        raise
-                session.cwd(name)
-                store_file(session, localpath)
-                session.cwd("..")
+def get_local_files(path="."):
+    """
+    Files to deploy: the ones tracked by git, or every file in the tree when
+    git is not available, skipping the IGNORE entries either way.
+    """
+    try:
+        tracked = subprocess.run(
+            ["git", "ls-files"],
+            cwd=path,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.splitlines()
+    except (OSError, subprocess.CalledProcessError):
+        tracked = [
+            os.path.relpath(os.path.join(root, name), path).replace(
+                os.sep, "/"
+            )
+            for root, _, names in os.walk(path)
+            for name in names
+        ]
+    return sorted(
+        name
+        for name in tracked
+        if not set(name.split("/")) & set(IGNORE)
+        and "__pycache__" not in name
+        and os.path.isfile(os.path.join(path, name))
+    )
 
 
-if __name__ == "__main__":
-    with FTP(
+def get_local_manifest(files, path="."):
+    manifest = {}
+    for name in files:
+        with open(os.path.join(path, name), "rb") as file:
+            manifest[name] = hashlib.sha256(file.read()).hexdigest()
+    return manifest
+
+
+def get_remote_manifest(session):
+    content = BytesIO()
+    try:
+        session.retrbinary(f"RETR {MANIFEST_FILE}", content.write)
+        return json.loads(content.getvalue())
+    except (error_perm, ValueError):
+        return {}
+
+
+def open_session():
+    session = FTP(
         Config.FTP_HOSTNAME, Config.FTP_USERNAME, Config.FTP_PASSWORD
-    ) as session:
-        session.encoding = "utf-8"
-        store_file(session=session, path=".")
+    )
+    session.encoding = "utf-8"
+    return session
+
+
+def make_dirs(session, name):
+    parts = name.split("/")[:-1]
+    for depth in range(1, len(parts) + 1):
+        try:
+            session.mkd("/".join(parts[:depth]))
+        # ignore "directory already exists"
+        except error_perm as e:
+            if not e.args[0].startswith("550"):
+                raise
+
+
+def upload_files(files, path="."):
+    """
+    Uploads the files under a temporary name, over one FTP session per
+    worker.
+    """
+    if not files:
+        return
+    chunks = [files[worker::SESSIONS] for worker in range(SESSIONS)]
+
+    def upload_chunk(chunk):
+        with open_session() as session:
+            for name in chunk:
+                make_dirs(session, name)
+                with open(os.path.join(path, name), "rb") as file:
+                    session.storbinary(f"STOR {name}{UPLOAD_SUFFIX}", file)
+                print(f"Uploaded {name}")
+
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        list(executor.map(upload_chunk, [chunk for chunk in chunks if chunk]))
+
+
+def swap_files(session, files):
+    """
+    Renames the uploaded files into place once every upload succeeded, so a
+    run starting mid-deploy never picks up half the new code.
+    """
+    for name in files:
+        try:
+            session.rename(f"{name}{UPLOAD_SUFFIX}", name)
+        except error_perm:
+            # Some servers refuse to rename over an existing file.
+            session.delete(name)
+            session.rename(f"{name}{UPLOAD_SUFFIX}", name)
+
+
+def deploy(path="."):
+    """
+    Uploads only the files whose content hash differs from the manifest of
+    the last deploy.
+    """
+    local_manifest = get_local_manifest(get_local_files(path), path)
+    with open_session() as session:
+        remote_manifest = get_remote_manifest(session)
+    changed = [
+        name
+        for name, content_hash in local_manifest.items()
+        if remote_manifest.get(name) != content_hash
+    ]
+    print(f"{len(changed)} of {len(local_manifest)} files changed.")
+    upload_files(changed, path)
+    with open_session() as session:
+        swap_files(session, changed)
+        session.storbinary(
+            f"STOR {MANIFEST_FILE}",
+            BytesIO(json.dumps(local_manifest, indent=2).encode("utf-8")),
+        )
+
+
+if __name__ == "__main__":
+    deploy(path=".")
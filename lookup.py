@@ -0,0 +1,57 @@
+import argparse
+import json
+import re
+import sys
+import time
+
+sys.path.append("/home/aukiozgq/order_puller/")
+from src.connectors.cache_connector import CacheConnector
+from src.sync.snapshot import SnapshotReader
+
+
+def parse_sku(value):
+    """
+    Same canonical int key as normalize_skus, without pandas.
+    """
+    value = re.sub(r"\.0+$", "", str(value).strip())
+    if not re.fullmatch(r"\d{1,18}", value) or not int(value):
+        raise ValueError(f"{value} is not a numeric sku.")
+    return int(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Looks skus up in the snapshot of the last merge, "
+        "without downloading or parsing anything."
+    )
+    parser.add_argument("skus", nargs="*", help="Skus to look up.")
+    parser.add_argument(
+        "--file", help="File with one sku per line, for bulk lookups."
+    )
+    parser.add_argument(
+        "--summary",
+        action="store_true",
+        help="Products won by every source instead.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    s = time.perf_counter()
+    reader = SnapshotReader(cache_connector=CacheConnector())
+    if not reader.paths:
+        sys.exit("No snapshot yet, it is written by the merge of every run.")
+    if args.summary:
+        print(json.dumps(reader.summary(), indent=2))
+    else:
+        values = list(args.skus)
+        if args.file:
+            with open(args.file) as file:
+                values += [line for line in file if line.strip()]
+        skus = [parse_sku(value) for value in values]
+        records = reader.lookup(skus)
+        for sku in skus:
+            print(json.dumps(records.get(sku, {"sku": sku, "found": False})))
+    elapsed = time.perf_counter() - s
+    print(f"Looked up in {elapsed * 1000:0.1f} ms.", file=sys.stderr)
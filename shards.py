@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+
+import pytz
+
+sys.path.append("/home/aukiozgq/order_puller/")
+from src.connectors.cache_connector import CacheConnector
+from src.connectors.config_connector import ConfigConnector
+from src.logging.logger import get_module_logger, use_log_file_suffix
+from src.settings import Config
+from src.sync.fingerprint import (
+    FINGERPRINT_CACHE,
+    check_run,
+    save_run_fingerprint,
+)
+from src.sync.shards import (
+    SHARD_RUN_CACHE,
+    get_shard_report_cache,
+    parse_shard,
+)
+from src.sync.snapshot import get_snapshot_name, set_snapshot_layout
+
+logger = get_module_logger(__name__)
+
+SHARD_RUN_REPORT_CACHE = "shards/run_report.json"
+REPORT_POLL_SECONDS = 5
+
+
+class ShardCoordinator:
+    """
+    Runs the puller split in `count` shards of the SKU space.
+    The coordinator downloads and parses the sources once into the source
+    cache, and loads the whitelist and Woo catalogue of every store once,
+    then every shard worker merges and pushes only its own skus from them.
+    Workers run as local processes, or on other hosts sharing the cache
+    folder with `python shards.py --shard index/count`, in which case only
+    the `local_shards` are spawned here and the coordinator waits up to
+    `shard_timeout_minutes` for the reports of the others.
+    last_check and the run fingerprint are only written once every shard
+    reported a complete push.
+    """
+
+    def __init__(self, count, local_shards=None):
+        self.count = count
+        self.local_shards = (
+            list(range(count)) if local_shards is None else local_shards
+        )
+        self.cache_connector = CacheConnector()
+
+    async def run(self):
+        started_at = time.time()
+        config_connector = ConfigConnector()
+        config = config_connector.get_config()
+        skip, run_fingerprint = await asyncio.to_thread(
+            check_run, config=config, cache_connector=self.cache_connector
+        )
+        if skip:
+            logger.info(msg="Nothing changed since the last run. Skipping.")
+            return None
+        now = datetime.now(pytz.utc).strftime(Config.DATE_FORMAT)
+        # Remote workers wait until the new run is prepared, instead of
+        # pushing from the inputs of the previous one.
+        self.cache_connector.set_json(SHARD_RUN_CACHE, {"count": self.count})
+
+        from src.puller import (
+            delete_all_local_sources,
+            prepare_shard_inputs,
+            prepare_sources,
+        )
+
+        await asyncio.gather(
+            prepare_sources(
+                config=config, download=not config.get("use_local", False)
+            ),
+            asyncio.to_thread(prepare_shard_inputs, config=config),
+        )
+        prepared_at = time.time()
+        run_id = f"{prepared_at:0.0f}"
+        self.cache_connector.set_json(
+            SHARD_RUN_CACHE,
+            {
+                "run_id": run_id,
+                "count": self.count,
+                "prepared_at": prepared_at,
+            },
+        )
+        set_snapshot_layout(
+            self.cache_connector,
+            [
+                get_snapshot_name((index, self.count))
+                for index in range(self.count)
+            ],
+        )
+
+        exit_codes = await asyncio.gather(
+            *[self._spawn(index, run_id) for index in self.local_shards]
+        )
+        for index, exit_code in zip(self.local_shards, exit_codes):
+            if exit_code:
+                logger.error(msg=f"Shard {index} exited with {exit_code}.")
+        reports = await self._collect_reports(
+            run_id, config.get("shard_timeout_minutes", 60) * 60
+        )
+
+        run_report = {
+            "run_id": run_id,
+            "count": self.count,
+            "prepare": round(prepared_at - started_at, 3),
+            "total": round(time.time() - started_at, 3),
+            "products": sum(
+                report.get("products", 0) for report in reports.values()
+            ),
+            "missing": [
+                index for index in range(self.count) if index not in reports
+            ],
+            "incomplete": [
+                index
+                for index, report in reports.items()
+                if not report.get("complete")
+            ],
+            "shards": reports,
+        }
+        run_report["complete"] = not (
+            run_report["missing"] or run_report["incomplete"]
+        )
+        self.cache_connector.set_json(SHARD_RUN_REPORT_CACHE, run_report)
+
+        dryrun = config.get("dryrun", True)
+        if run_report["complete"] and not dryrun:
+            logger.info(msg="---- Every shard completed, writing config.")
+            config = config_connector.get_config()
+            config["last_check"] = now
+            config_connector.set_config(config)
+            if run_fingerprint:
+                save_run_fingerprint(
+                    cache_connector=self.cache_connector,
+                    fingerprint=run_fingerprint,
+                )
+        elif not run_report["complete"]:
+            logger.warning(
+                msg=f"Shards {run_report['missing']} did not report and "
+                f"{run_report['incomplete']} did not complete, keeping "
+                f"last_check."
+            )
+            # The shard journals are not part of the fingerprint, make sure
+            # the next run goes ahead and resumes them.
+            self.cache_connector.delete(FINGERPRINT_CACHE)
+        if config.get("cleanup", True):
+            delete_all_local_sources(config=config)
+        return run_report
+
+    async def _spawn(self, index, run_id):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            __file__,
+            "--shard",
+            f"{index}/{self.count}",
+            "--run-id",
+            run_id,
+        )
+        return await process.wait()
+
+    async def _collect_reports(self, run_id, timeout):
+        """
+        Reads the report of every shard of the run, waiting for the remote
+        ones until the timeout.
+        """
+        deadline = time.time() + timeout
+        reports = {}
+        while True:
+            for index in range(self.count):
+                report = self.cache_connector.get_json(
+                    get_shard_report_cache((index, self.count)), default={}
+                )
+                if report.get("run_id") == run_id:
+                    reports[index] = report
+            remote_pending = len(reports) < self.count and any(
+                index not in self.local_shards for index in range(self.count)
+            )
+            if not remote_pending or time.time() >= deadline:
+                return reports
+            await asyncio.sleep(REPORT_POLL_SECONDS)
+
+
+def wait_for_run(cache_connector, shard, run_id=None, timeout=3600):
+    """
+    Waits up to timeout seconds for the coordinator to prepare the run_id
+    run, or any run the shard has not reported yet, and returns it.
+    Runs prepared longer than timeout ago were already given up by their
+    coordinator, and are never worked on.
+    """
+    deadline = time.time() + timeout
+    while True:
+        shard_run = cache_connector.get_json(SHARD_RUN_CACHE, default={})
+        report = cache_connector.get_json(
+            get_shard_report_cache(shard), default={}
+        )
+        prepared_run_id = shard_run.get("run_id")
+        if (
+            prepared_run_id
+            and shard_run.get("count") == shard[1]
+            and time.time() - shard_run.get("prepared_at", 0) < timeout
+            and (
+                prepared_run_id == run_id
+                if run_id
+                else prepared_run_id != report.get("run_id")
+            )
+        ):
+            return shard_run
+        if time.time() >= deadline:
+            raise ValueError(
+                f"No prepared run for {shard[1]} shards, start the "
+                f"coordinator first."
+            )
+        logger.info(msg="Waiting for the coordinator to prepare the run.")
+        time.sleep(REPORT_POLL_SECONDS)
+
+
+def run_shard(shard, run_id=None):
+    """
+    Runs a single shard worker once its run is prepared, and writes its
+    report for the coordinator. Every worker logs to its own file.
+    """
+    use_log_file_suffix(f"shard_{shard[0]}_of_{shard[1]}")
+    cache_connector = CacheConnector()
+    config = ConfigConnector().get_config()
+    shard_run = wait_for_run(
+        cache_connector,
+        shard,
+        run_id=run_id,
+        timeout=config.get("shard_timeout_minutes", 60) * 60,
+    )
+
+    from src.puller import main
+
+    report = asyncio.run(main(shard=shard, run_id=shard_run["run_id"]))
+    report.update(run_id=shard_run["run_id"], shard=shard[0])
+    cache_connector.set_json(get_shard_report_cache(shard), report)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Runs the puller split in shards of the SKU space."
+    )
+    parser.add_argument(
+        "shards", nargs="?", type=int, help="Coordinate this many shards."
+    )
+    parser.add_argument(
+        "--local-shards",
+        help="Comma separated shard indexes to spawn locally, all of them "
+        "by default.",
+    )
+    parser.add_argument(
+        "--shard", type=parse_shard, help="Run the index/count shard worker."
+    )
+    parser.add_argument(
+        "--run-id",
+        help="Run of the shard worker, the next one it has not reported by "
+        "default.",
+    )
+    args = parser.parse_args()
+    if (args.shards is None) == (args.shard is None):
+        parser.error("Either the shard count or --shard is required.")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.shard:
+        run_shard(args.shard, run_id=args.run_id)
+    else:
+        local_shards = None
+        if args.local_shards is not None:
+            local_shards = [
+                int(index) for index in args.local_shards.split(",") if index
+            ]
+        report = asyncio.run(
+            ShardCoordinator(args.shards, local_shards=local_shards).run()
+        )
+        if report:
+            print(
+                f"{args.shards} shards pushed {report['products']} products "
+                f"in {report['total']:0.2f} seconds."
+            )
@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from src.logging.logger import get_module_logger
+
+logger = get_module_logger(__name__)
+
+try:
+    import pyarrow  # noqa: F401
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+class ArtifactConnector:
+    """
+    Handles the writing of debug artifacts (intermediate snapshots of a run)
+    into tmp/artifacts/<run>/, or tmp/artifacts/<run>/<part>/ for the worker
+    processes of a run split in parts, such as the shards of run_id.
+    Writes happen on a background thread, off the critical path, and only
+    when `artifacts.enabled` is set or the run is a dryrun. Data frames are
+    written as parquet when pyarrow is installed, pickled otherwise. Only the
+    last `artifacts.retention` runs are kept.
+    """
+
+    def __init__(self, config, run_id=None, part=None):
+        artifacts_config = config.get("artifacts", {})
+        self.enabled = artifacts_config.get("enabled", False) or config.get(
+            "dryrun", True
+        )
+        self.retention = artifacts_config.get("retention", 10)
+        self.artifacts_folder = "tmp/artifacts"
+        started_at = time.localtime(float(run_id) if run_id else None)
+        # The pid keeps apart the runs starting in the same second.
+        self.run_name = (
+            f"{time.strftime('%Y%m%d-%H%M%S', started_at)}-"
+            f"{run_id or os.getpid()}"
+        )
+        self.run_folder = f"{self.artifacts_folder}/{self.run_name}"
+        if part:
+            self.run_folder = f"{self.run_folder}/{part}"
+        self.executor = None
+        if self.enabled:
+            os.makedirs(self.run_folder, exist_ok=True)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def write_df(self, name, products_df):
+        if self.enabled:
+            self.executor.submit(self._write_df, name, products_df.copy())
+
+    def append_json_lines(self, name, contents):
+        if self.enabled:
+            self.executor.submit(self._append_json_lines, name, list(contents))
+
+    def close(self):
+        """
+        Waits for the pending writes and drops the runs past the retention,
+        never the current one, which other parts may still be writing.
+        """
+        if self.enabled:
+            self.executor.shutdown(wait=True)
+            runs = sorted(
+                run
+                for run in os.listdir(self.artifacts_folder)
+                if run != self.run_name
+            )
+            for run in runs[: max(len(runs) + 1 - self.retention, 0)]:
+                shutil.rmtree(
+                    f"{self.artifacts_folder}/{run}", ignore_errors=True
+                )
+
+    def _write_df(self, name, products_df):
+        path = f"{self.run_folder}/{name}"
+        try:
+            if PARQUET_AVAILABLE:
+                try:
+                    products_df.to_parquet(f"{path}.parquet", index=False)
+                    return
+                except Exception as parquet_error:
+                    logger.warning(
+                        f"Could not write {name} as parquet, pickling it. "
+                        f"{parquet_error}"
+                    )
+            products_df.to_pickle(f"{path}.pkl")
+        except Exception as error:
+            logger.error(
+                f"Could not write the {name} artifact. \n"
+                f"Error: {error}. \n"
+                f"Traceback: {traceback.format_exc()}"
+            )
+
+    def _append_json_lines(self, name, contents):
+        try:
+            with open(f"{self.run_folder}/{name}.jsonl", "a") as file:
+                for content in contents:
+                    file.write(json.dumps(content) + "\n")
+        except Exception as error:
+            logger.error(
+                f"Could not write the {name} artifact. \n"
+                f"Error: {error}. \n"
+                f"Traceback: {traceback.format_exc()}"
+            )
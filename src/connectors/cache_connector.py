@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import time
+
+from src.settings import Config
+
+
+class CacheConnector:
+    """
+    Handles the communication to the local cache folder.
+    Files survive between runs, and are always written atomically so a run
+    dying mid-write never leaves a half written cache behind.
+    A namespace keeps the state of one Woo store apart from the others.
+    """
+
+    def __init__(self, namespace=None):
+        self.cache_folder = Config.CACHE_FOLDER
+        if namespace:
+            self.cache_folder = f"{self.cache_folder}/stores/{namespace}"
+        is_exist = os.path.exists(self.cache_folder)
+        if not is_exist:
+            os.makedirs(self.cache_folder)
+
+    def get_path(self, filename):
+        return f"{self.cache_folder}/{filename}"
+
+    def get_age(self, filename):
+        """
+        Seconds since the cached file was last written, None if missing.
+        """
+        try:
+            return time.time() - os.path.getmtime(self.get_path(filename))
+        except OSError:
+            return None
+
+    def get_bytes(self, filename):
+        try:
+            with open(self.get_path(filename), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def set_bytes(self, filename, content):
+        path = self.get_path(filename)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # A temp file of its own, processes sharing the cache folder may be
+        # writing the same file at once.
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get_json(self, filename, default=None):
+        content = self.get_bytes(filename)
+        if content is None:
+            return default
+        try:
+            return json.loads(content)
+        except ValueError:
+            return default
+
+    def set_json(self, filename, content):
+        self.set_bytes(filename, json.dumps(content).encode("utf-8"))
+
+    def append_json_line(self, filename, content):
+        """
+        Appends one JSON line and flushes it to disk before returning, so
+        the line survives the process dying right after.
+        """
+        with open(self.get_path(filename), "a") as file:
+            file.write(json.dumps(content) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def get_json_lines(self, filename):
+        lines = []
+        try:
+            with open(self.get_path(filename)) as file:
+                for line in file:
+                    try:
+                        lines.append(json.loads(line))
+                    except ValueError:
+                        # A line cut short by a crash, ignore it.
+                        pass
+        except OSError:
+            pass
+        return lines
+
+    def delete(self, filename):
+        try:
+            os.remove(self.get_path(filename))
+        except OSError:
+            pass
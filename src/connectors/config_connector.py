@@ -1,4 +1,6 @@
+import copy
 import json
+import os
 
 from src.settings import Config
 
@@ -8,11 +10,25 @@ class ConfigConnector:
     Handles the communication to local config file
     """
 
+    # Parsed config, keyed by the file modification time. Only outlives a
+    # run in daemon mode, where the process stays resident.
+    _cached_config = None
+    _cached_mtime = None
+
     def get_config(self):
-        with open(Config.CONFIG_FILE) as config_file:
-            json_content = json.load(config_file)
-            return json_content
+        mtime = os.path.getmtime(Config.CONFIG_FILE)
+        if ConfigConnector._cached_mtime != mtime:
+            with open(Config.CONFIG_FILE) as config_file:
+                ConfigConnector._cached_config = json.load(config_file)
+            ConfigConnector._cached_mtime = mtime
+        return copy.deepcopy(ConfigConnector._cached_config)
 
     def set_config(self, config):
-        with open(Config.CONFIG_FILE, "w") as f:
+        # Written to a temporary file first and swapped in, so a run dying
+        # mid-write can never leave a truncated config behind.
+        tmp_config_file = f"{Config.CONFIG_FILE}.tmp"
+        with open(tmp_config_file, "w") as f:
             json.dump(config, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_config_file, Config.CONFIG_FILE)
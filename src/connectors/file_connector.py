@@ -1,3 +1,4 @@
+import hashlib
 import os
 import traceback
 from io import BytesIO
@@ -40,6 +41,36 @@ class FileConnector:
                 file.write(url_content)
                 file.close()
 
+    def read_url_conditionally(
+        self, source_url, etag=None, last_modified=None
+    ):
+        """
+        Downloads the url revalidating against the given validators.
+        Returns (content, validators), content being None when the remote
+        file was not modified since the validators were taken.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        req = requests.get(source_url, headers=headers, timeout=60)
+        validators = {
+            "etag": req.headers.get("ETag", etag),
+            "last_modified": req.headers.get("Last-Modified", last_modified),
+        }
+        if req.status_code == 304:
+            return None, validators
+        req.raise_for_status()
+        return req.content, validators
+
+    def get_etag(self, source_url):
+        try:
+            req = requests.head(source_url, allow_redirects=True, timeout=10)
+            return req.headers.get("ETag")
+        except requests.RequestException:
+            return None
+
     def read_and_write_ftp_locally(
         self, source_url, file_path, filename, expected_file, user, password
     ):
@@ -93,6 +124,19 @@ class FileConnector:
             logger.warn(f"Source {filename} was not found locally. Moving on.")
             return None
 
+    def hash_local_file(self, filename):
+        """
+        sha1 of the content of a local file, None when it does not exist.
+        """
+        try:
+            digest = hashlib.sha1()
+            with open(f"{self.tmp_folder}/{filename}", "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        except OSError:
+            return None
+
     def delete_local_file(self, filename):
         try:
             os.remove(f"{self.tmp_folder}/{filename}")
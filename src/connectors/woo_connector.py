@@ -1,10 +1,19 @@
-import json
-
+import numpy as np
 import pandas as pd
 from woocommerce import API
 
 from src.logging import logger
 from src.settings import Config
+from src.skus import normalize_skus
+
+CATALOGUE_FIELDS = "id,sku,tags,regular_price,stock_quantity"
+CATALOGUE_COLUMNS = {
+    "id": np.int64,
+    "sku": np.int64,
+    "bot": bool,
+    "regular_price": np.float64,
+    "stock": np.float64,
+}
 
 
 class WooConnector:
@@ -12,12 +21,12 @@ class WooConnector:
     Handles the communication to the Woo API
     """
 
-    def __init__(self):
+    def __init__(self, url=None, consumer_key=None, consumer_secret=None):
         self.page_size = 100
         self.wcapi = API(
-            url=Config.WCAPI_URL,
-            consumer_key=Config.ACCESS_KEY_ID,
-            consumer_secret=Config.ACCESS_KEY,
+            url=url or Config.WCAPI_URL,
+            consumer_key=consumer_key or Config.ACCESS_KEY_ID,
+            consumer_secret=consumer_secret or Config.ACCESS_KEY,
             timeout=500,
             version="wc/v3",
         )
@@ -26,8 +35,7 @@ class WooConnector:
         self.wcapi.put(f"products/{product['id']}", product)
 
     def batch_push_product(self, products, verb="create"):
-        products_json = json.loads(products)
-        data = {verb: products_json}
+        data = {verb: products}
         result = self.wcapi.post(f"products/batch", data)
         return result
 
@@ -37,24 +45,137 @@ class WooConnector:
             return product.json()
         return None
 
-    def get_products_df(self):
-        products = self._get_products_all_pages()
-        products_df = pd.DataFrame(products)
-        return products_df
+    def get_products_df(self, bot_tag_id, modified_after=None):
+        """
+        Gets every product, or only the ones modified after the given UTC
+        ISO 8601 date, as a compact frame of int64 sku, Woo id, price,
+        stock and whether the product carries the bot_tag_id tag.
+        Only those fields are requested, and every page is reduced to
+        arrays as soon as it arrives, so the product JSON never piles up.
+        """
+        columns = {column: [] for column in CATALOGUE_COLUMNS}
+        for products in self._get_products_pages(
+            modified_after=modified_after
+        ):
+            for column, values in _project_products(
+                products, bot_tag_id
+            ).items():
+                columns[column].append(values)
+        return pd.DataFrame(
+            {
+                column: (
+                    np.concatenate(values)
+                    if values
+                    else np.array([], dtype=dtype)
+                )
+                for (column, values), dtype in zip(
+                    columns.items(), CATALOGUE_COLUMNS.values()
+                )
+            }
+        )
 
-    def _get_products_all_pages(self):
+    def _get_products_pages(self, modified_after=None):
         page = 1
-        all_products = []
+        params = {"per_page": self.page_size, "_fields": CATALOGUE_FIELDS}
+        if modified_after:
+            params["modified_after"] = modified_after
+            params["dates_are_gmt"] = "true"
         while True:
             products = self.wcapi.get(
-                "products", params={"per_page": self.page_size, "page": page}
+                "products", params={**params, "page": page}
             )
             if products.status_code == 200:
                 products = products.json()
                 if len(products) == 0:  # no more products
                     break
-                all_products.extend(products)
+                yield products
                 page += 1
             else:
                 raise Exception(f"Error getting products. {products.reason}")
-        return all_products
+
+    def get_categories_since(self, known_max_id=0):
+        """
+        Gets the product categories newer than known_max_id, newest first,
+        stopping at the first page that reaches already known ids.
+        """
+        page = 1
+        new_categories = []
+        while True:
+            categories = self.wcapi.get(
+                "products/categories",
+                params={
+                    "per_page": self.page_size,
+                    "page": page,
+                    "orderby": "id",
+                    "order": "desc",
+                },
+            )
+            if categories.status_code != 200:
+                raise Exception(
+                    f"Error getting categories. {categories.reason}"
+                )
+            categories = categories.json()
+            new_categories.extend(
+                category
+                for category in categories
+                if category["id"] > known_max_id
+            )
+            if len(categories) < self.page_size or any(
+                category["id"] <= known_max_id for category in categories
+            ):
+                break
+            page += 1
+        return new_categories
+
+    def batch_create_categories(self, names):
+        """
+        Creates the categories, returning a name -> id dict. Categories that
+        already exist are resolved to their existing id.
+        """
+        data = {"create": [{"name": name} for name in names]}
+        result = self.wcapi.post("products/categories/batch", data)
+        if result.status_code != 200:
+            raise Exception(f"Error creating categories. {result.reason}")
+        created = {}
+        for name, category in zip(names, result.json().get("create", [])):
+            category_id = category.get("id") or (
+                category.get("error", {}).get("data", {}).get("resource_id")
+            )
+            if category_id:
+                created[name] = category_id
+        return created
+
+
+def _project_products(products, bot_tag_id) -> dict:
+    """
+    Reduces a page of product JSON to the CATALOGUE_COLUMNS arrays.
+    The bot tag flag is computed over the flattened tag ids of the whole
+    page at once.
+    """
+    tag_counts = [len(product.get("tags") or ()) for product in products]
+    tag_ids = np.array(
+        [
+            tag.get("id")
+            for product in products
+            for tag in product.get("tags") or ()
+        ],
+        dtype=np.int64,
+    )
+    owners = np.repeat(np.arange(len(products)), tag_counts)
+    bot = np.zeros(len(products), dtype=bool)
+    bot[owners[tag_ids == bot_tag_id]] = True
+    return {
+        "id": np.array([product["id"] for product in products], np.int64),
+        "sku": normalize_skus(
+            pd.Series([product.get("sku") or "" for product in products])
+        ).to_numpy(),
+        "bot": bot,
+        "regular_price": pd.to_numeric(
+            pd.Series([product.get("regular_price") for product in products]),
+            errors="coerce",
+        ).to_numpy(dtype=np.float64),
+        "stock": pd.to_numeric(
+            pd.Series([product.get("stock_quantity") for product in products]),
+            errors="coerce",
+        ).to_numpy(dtype=np.float64),
+    }
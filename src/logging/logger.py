@@ -1,24 +1,102 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
 
 from src.settings import Config
 
+_queue_handler = None
+_listener = None
+
 
 def get_module_logger(mod_name):
     """
     To use this, do logging = get_module_logger(__name__)
+    Records go through a queue to a background listener thread, so the
+    stream and file I/O never happens on the caller's thread.
     """
     logger = logging.getLogger(mod_name)
-    handler = logging.StreamHandler()
+    queue_handler = _get_queue_handler()
+    if queue_handler not in logger.handlers:
+        logger.addHandler(queue_handler)
+    # Parent module loggers carry the same handler, e.g. src.mappers for
+    # src.mappers.categories, so propagating would log every line twice.
+    logger.propagate = False
+    logger.setLevel(Config.LOG_LEVEL)
+    return logger
+
+
+def _get_queue_handler():
+    """
+    Configures the handlers once per process, however many modules ask for
+    a logger.
+    """
+    global _queue_handler, _listener
+    if _queue_handler is None:
+        if Config.LOG_FORMAT == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(
+                "[%(asctime)s]-------[%(levelname)s]------- %(message)s"
+            )
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+
+        file_handler = _get_file_handler(Config.LOG_FILE_NAME, formatter)
+
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(
+            log_queue, handler, file_handler
+        )
+        _listener.start()
+        # Flushes whatever is still queued when the process exits.
+        atexit.register(_listener.stop)
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+    return _queue_handler
+
 
-    formatter = logging.Formatter(
-        "[%(asctime)s]-------[%(levelname)s]------- %(message)s"
+def use_log_file_suffix(suffix):
+    """
+    Moves the file logging of this process to its own file, e.g.
+    `puller.shard_0_of_4.log` for `puller.log`. Processes that log at once
+    need their own files, since each one rotates on its own size check.
+    """
+    _get_queue_handler()
+    handler, file_handler = _listener.handlers
+    root, extension = os.path.splitext(Config.LOG_FILE_NAME)
+    _listener.stop()
+    file_handler.close()
+    _listener.handlers = (
+        handler,
+        _get_file_handler(f"{root}.{suffix}{extension}", handler.formatter),
     )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    _listener.start()
+
 
-    file_handler = logging.FileHandler(Config.LOG_FILE_NAME)
+def _get_file_handler(file_name, formatter):
+    file_handler = logging.handlers.RotatingFileHandler(
+        file_name,
+        maxBytes=Config.LOG_MAX_BYTES,
+        backupCount=Config.LOG_BACKUP_COUNT,
+    )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    return file_handler
 
-    logger.setLevel(Config.LOG_LEVEL)
-    return logger
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for structured log ingestion.
+    """
+
+    def format(self, record):
+        content = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            content["exception"] = self.formatException(record.exc_info)
+        return json.dumps(content)
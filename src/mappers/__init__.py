@@ -1,8 +1,11 @@
 import traceback
 
+import numpy as np
 import pandas as pd
 
 from src.logging.logger import get_module_logger
+from src.mappers.categories import CATEGORY_DICTIONARY
+from src.skus import INVALID_SKU, to_ean_keys
 
 logger = get_module_logger(__name__)
 
@@ -14,6 +17,9 @@ FINAL_COLUMNS = [
     "categories",
     "regular_price",
     "images",
+    # Tax multiplier applied to regular_price, NaN for supplier prices that
+    # already include it.
+    "applied_tax",
 ]
 
 
@@ -58,21 +64,24 @@ def map_mcr(products_df: pd.DataFrame, config) -> pd.DataFrame:
             "Imagen": "images",
         }
     )
-    products_df["sku"] = products_df["sku"].astype(str)
-    products_df["categories"] = products_df.apply(
-        lambda x: [
-            {"id": x["idCategoria1"], "name": x["categoria1"]},
-            {"id": x["idCategoria2"], "name": x["categoria2"]},
-            {"id": x["idCategoria3"], "name": x["categoria3"]},
+    products_df = treat_sku(products_df, config)
+    products_df["categories"] = CATEGORY_DICTIONARY.encode(
+        products_df,
+        source="mcr",
+        levels=[
+            ("idCategoria1", "categoria1"),
+            ("idCategoria2", "categoria2"),
+            ("idCategoria3", "categoria3"),
         ],
-        axis=1,
     )
 
     products_df = treat_price(products_df, "regular_price_base")
 
     products_df["regular_price"] = products_df["regular_price_base"] * tax
     products_df.drop(["regular_price_base"], axis=1, inplace=True)
-    products_df.images = products_df.images.apply(lambda s: [{"src": s}])
+    products_df["images"] = products_df["images"].astype("category")
+
+    products_df["applied_tax"] = tax
 
     return products_df[FINAL_COLUMNS]
 
@@ -90,13 +99,11 @@ def map_megasur(products_df: pd.DataFrame, config) -> pd.DataFrame:
             "URL_IMG": "images",
         }
     )
-    products_df["sku"] = products_df["sku"].astype(str)
-    products_df["categories"] = products_df.apply(
-        lambda x: [
-            {"id": x["ID_FAMILIA"], "name": x["FAMILIA"]},
-            {"id": x["ID_SUBFAMILIA"], "name": x["SUBFAMILIA"]},
-        ],
-        axis=1,
+    products_df = treat_sku(products_df, config)
+    products_df["categories"] = CATEGORY_DICTIONARY.encode(
+        products_df,
+        source="megasur",
+        levels=[("ID_FAMILIA", "FAMILIA"), ("ID_SUBFAMILIA", "SUBFAMILIA")],
     )
 
     products_df = treat_price(products_df, "regular_price_base")
@@ -109,7 +116,9 @@ def map_megasur(products_df: pd.DataFrame, config) -> pd.DataFrame:
         ["regular_price_base", "regular_price_base"], axis=1, inplace=True
     )
 
-    products_df.images = products_df.images.apply(lambda s: [{"src": s}])
+    products_df["images"] = products_df["images"].astype("category")
+
+    products_df["applied_tax"] = tax
 
     return products_df[FINAL_COLUMNS]
 
@@ -125,18 +134,21 @@ def map_bts(products_df: pd.DataFrame, config) -> pd.DataFrame:
             "Imagen": "images",
         }
     )
-    products_df["sku"] = products_df["sku"].astype(str)
-    products_df["categories"] = products_df.apply(
-        lambda x: [
-            {"id": x["idCategoria1"], "name": x["categoria1"]},
-            {"id": x["idCategoria2"], "name": x["categoria2"]},
-            {"id": x["idCategoria3"], "name": x["categoria3"]},
-            {"id": x["idCategoria4"], "name": x["categoria4"]},
+    products_df = treat_sku(products_df, config)
+    products_df["categories"] = CATEGORY_DICTIONARY.encode(
+        products_df,
+        source="bts",
+        levels=[
+            ("idCategoria1", "categoria1"),
+            ("idCategoria2", "categoria2"),
+            ("idCategoria3", "categoria3"),
+            ("idCategoria4", "categoria4"),
         ],
-        axis=1,
     )
 
-    products_df.images = products_df.images.apply(lambda s: [{"src": s}])
+    products_df["images"] = products_df["images"].astype("category")
+
+    products_df["applied_tax"] = np.nan
 
     return products_df[FINAL_COLUMNS]
 
@@ -154,9 +166,11 @@ def map_supercomp(products_df: pd.DataFrame, config) -> pd.DataFrame:
             "IMAGEN": "images",
         }
     )
-    products_df["sku"] = products_df["sku"].astype(str)
-    products_df["categories"] = products_df.apply(
-        lambda x: [{"id": x["IDCATEGORIA"], "name": x["CATEGORIA"]}], axis=1
+    products_df = treat_sku(products_df, config)
+    products_df["categories"] = CATEGORY_DICTIONARY.encode(
+        products_df,
+        source="supercomp",
+        levels=[("IDCATEGORIA", "CATEGORIA")],
     )
 
     products_df = treat_price(products_df, "regular_price_base")
@@ -168,7 +182,9 @@ def map_supercomp(products_df: pd.DataFrame, config) -> pd.DataFrame:
     products_df.drop(
         ["regular_price_base", "regular_price_base"], axis=1, inplace=True
     )
-    products_df.images = products_df.images.apply(lambda s: [{"src": s}])
+    products_df["images"] = products_df["images"].astype("category")
+    products_df["applied_tax"] = tax
+
     return products_df[FINAL_COLUMNS]
 
 
@@ -185,13 +201,11 @@ def map_globo(products_df: pd.DataFrame, config) -> pd.DataFrame:
             "Imagen": "images",
         }
     )
-    products_df["sku"] = products_df["sku"].astype(str)
-    products_df["categories"] = products_df.apply(
-        lambda x: [
-            {"name": x["Familia"]},
-            {"name": x["SubFamilia"]},
-        ],
-        axis=1,
+    products_df = treat_sku(products_df, config)
+    products_df["categories"] = CATEGORY_DICTIONARY.encode(
+        products_df,
+        source="globomatik",
+        levels=[(None, "Familia"), (None, "SubFamilia")],
     )
 
     products_df = treat_price(products_df, "regular_price_base")
@@ -203,7 +217,9 @@ def map_globo(products_df: pd.DataFrame, config) -> pd.DataFrame:
     products_df.drop(
         ["regular_price_base", "regular_price_base"], axis=1, inplace=True
     )
-    products_df.images = products_df.images.apply(lambda s: [{"src": s}])
+    products_df["images"] = products_df["images"].astype("category")
+
+    products_df["applied_tax"] = tax
 
     return products_df[FINAL_COLUMNS]
 
@@ -217,14 +233,16 @@ def map_inpex(products_df: pd.DataFrame, config) -> pd.DataFrame:
             "precio_con_iva": "regular_price",
         }
     )
-    products_df["sku"] = products_df["sku"].astype(str)
+    products_df = treat_sku(products_df, config)
     products_df["description"] = products_df["name"]
-    products_df["categories"] = products_df.apply(
-        lambda x: [{"name": x["category"]}], axis=1
+    products_df["categories"] = CATEGORY_DICTIONARY.encode(
+        products_df, source="impexopcion", levels=[(None, "category")]
     )
 
     products_df["images"] = ""
 
+    products_df["applied_tax"] = np.nan
+
     return products_df[FINAL_COLUMNS]
 
 
@@ -239,9 +257,9 @@ def map_ingrammicro(products_df: pd.DataFrame, config) -> pd.DataFrame:
             "23": "regular_price_base",
         }
     )
-    products_df["sku"] = products_df["sku"].astype(str)
-    products_df["categories"] = products_df.apply(
-        lambda x: [{"name": x["1"]}], axis=1
+    products_df = treat_sku(products_df, config)
+    products_df["categories"] = CATEGORY_DICTIONARY.encode(
+        products_df, source="ingrammicro", levels=[(None, "1")]
     )
 
     products_df = treat_price(products_df, "regular_price_base")
@@ -253,6 +271,8 @@ def map_ingrammicro(products_df: pd.DataFrame, config) -> pd.DataFrame:
 
     products_df["images"] = ""
 
+    products_df["applied_tax"] = tax
+
     return products_df[FINAL_COLUMNS]
 
 
@@ -267,3 +287,16 @@ def treat_price(products_df: pd.DataFrame, column_name) -> pd.DataFrame:
         float, errors="ignore"
     )
     return products_df
+
+
+def treat_sku(products_df: pd.DataFrame, config) -> pd.DataFrame:
+    """
+    Turns the raw sku column into canonical int64 EAN keys, dropping the
+    rows that do not carry a usable EAN.
+    """
+    strict = config.get("strict_ean", False)
+    products_df["sku"] = to_ean_keys(products_df["sku"], strict=strict)
+    invalid = products_df["sku"] == INVALID_SKU
+    if invalid.any():
+        logger.info(f"Dropping {invalid.sum()} products without a valid EAN.")
+    return products_df[~invalid].copy()
@@ -0,0 +1,206 @@
+import html
+import threading
+import time
+
+import pandas as pd
+
+from src.logging.logger import get_module_logger
+
+logger = get_module_logger(__name__)
+
+CATEGORY_INDEX_CACHE = "woo_categories.json"
+CATEGORY_BATCH_SIZE = 100
+
+
+class CategoryDictionary:
+    """
+    Shared table of every supplier category seen during the run.
+    Products only carry tuples of integer codes into this table, and the Woo
+    shaped category dicts are built from it when the payloads are.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.categories = []
+        self.lock = threading.Lock()
+
+    def get_code(self, source, category_id, name):
+        category_id = _clean_id(category_id)
+        name = None if pd.isna(name) else str(name).strip() or None
+        key = (source, category_id, name)
+        with self.lock:
+            code = self.codes.get(key)
+            if code is None:
+                code = len(self.categories)
+                self.codes[key] = code
+                self.categories.append(key)
+        return code
+
+    def encode(self, products_df: pd.DataFrame, source, levels) -> list:
+        """
+        Encodes the category columns of every row into a tuple of codes.
+        `levels` is a list of (id_column, name_column) pairs, id_column being
+        None for sources that only provide category names.
+        Equal tuples are interned, so rows share a single tuple object.
+        """
+        level_codes = []
+        for id_column, name_column in levels:
+            level_df = pd.DataFrame(
+                {
+                    "id": products_df[id_column] if id_column else None,
+                    "name": products_df[name_column],
+                },
+                index=products_df.index,
+            ).astype(object)
+            group_codes = level_df.groupby(
+                ["id", "name"], dropna=False, sort=False
+            ).ngroup()
+            lookup = [
+                self.get_code(source, category_id, name)
+                for category_id, name in level_df.drop_duplicates().itertuples(
+                    index=False
+                )
+            ]
+            level_codes.append([lookup[code] for code in group_codes])
+
+        interned = {}
+        return [
+            interned.setdefault(codes, codes) for codes in zip(*level_codes)
+        ]
+
+    def export_keys(self, codes_column) -> list:
+        """
+        The supplier keys behind every code used in the column, so encoded
+        categories can be stored beyond the run that encoded them.
+        """
+        used_codes = {code for codes in codes_column for code in codes}
+        return [[code, *self.categories[code]] for code in used_codes]
+
+    def import_codes(self, codes_column, keys) -> list:
+        """
+        Re-encodes a column stored with export_keys into this run's codes.
+        """
+        new_codes = {
+            code: self.get_code(source, category_id, name)
+            for code, source, category_id, name in keys
+        }
+        interned = {}
+        return [
+            interned.setdefault(
+                codes, tuple(new_codes[code] for code in codes)
+            )
+            for codes in codes_column
+        ]
+
+    def decode(self, codes, woo_ids=None) -> list:
+        """
+        Materializes the Woo shaped `[{"id": ..}]` list.
+        woo_ids maps the codes already resolved to the Woo ids of the store
+        the payload goes to. Unresolved categories only carry their name,
+        supplier ids never go into the Woo `id` field.
+        """
+        woo_ids = woo_ids or {}
+        categories = []
+        for code in codes or ():
+            _, _, name = self.categories[code]
+            if name is None:
+                continue
+            if code in woo_ids:
+                categories.append({"id": woo_ids[code]})
+            else:
+                categories.append({"name": name})
+        return categories
+
+
+class CategoryIndex:
+    """
+    Persistent supplier category -> Woo category id index.
+    Built from the Woo `products/categories` endpoint and refreshed
+    incrementally with the categories created since the last run, so the
+    payloads always carry resolved ids and Woo never has to look them up.
+    """
+
+    def __init__(self, woo_connector, cache_connector, config):
+        self.woo_connector = woo_connector
+        self.cache_connector = cache_connector
+        self.create_missing = config.get("create_missing_categories", True)
+        self.full_refresh_hours = config.get(
+            "categories_full_refresh_hours", 24
+        )
+        self.index = cache_connector.get_json(CATEGORY_INDEX_CACHE, default={})
+
+    def refresh(self):
+        age_hours = (time.time() - self.index.get("built_at", 0)) / 3600
+        if age_hours >= self.full_refresh_hours:
+            logger.info("Rebuilding the Woo category index.")
+            self.index = {"built_at": time.time(), "max_id": 0, "names": {}}
+        new_categories = self.woo_connector.get_categories_since(
+            known_max_id=self.index["max_id"]
+        )
+        for category in new_categories:
+            self._add(category["name"], category["id"])
+        logger.info(
+            f"Woo category index has {len(self.index['names'])} categories, "
+            f"{len(new_categories)} new."
+        )
+
+    def resolve(self, category_dictionary, codes) -> dict:
+        """
+        Resolves the given category codes to the Woo ids of this store,
+        creating the categories Woo does not have yet.
+        Returns the code -> Woo id map of every code resolved.
+        """
+        self.refresh()
+        woo_ids = {}
+        missing = {}
+        for code in codes:
+            _, _, name = category_dictionary.categories[code]
+            if name is None:
+                continue
+            woo_id = self.index["names"].get(_normalize_name(name))
+            if woo_id:
+                woo_ids[code] = woo_id
+            else:
+                missing.setdefault(name, []).append(code)
+
+        if missing and self.create_missing:
+            names = list(missing.keys())
+            logger.info(f"Creating {len(names)} categories in Woo.")
+            for start in range(0, len(names), CATEGORY_BATCH_SIZE):
+                created = self.woo_connector.batch_create_categories(
+                    names[start : start + CATEGORY_BATCH_SIZE]
+                )
+                for name, woo_id in created.items():
+                    self._add(name, woo_id)
+                    for code in missing.pop(name):
+                        woo_ids[code] = woo_id
+
+        if missing:
+            logger.warning(f"Could not resolve {len(missing)} categories.")
+        self.save()
+        return woo_ids
+
+    def save(self):
+        self.cache_connector.set_json(CATEGORY_INDEX_CACHE, self.index)
+
+    def _add(self, name, woo_id):
+        names = self.index["names"]
+        key = _normalize_name(name)
+        names[key] = min(woo_id, names.get(key, woo_id))
+        self.index["max_id"] = max(self.index["max_id"], woo_id)
+
+
+def _normalize_name(name):
+    return html.unescape(str(name)).strip().casefold()
+
+
+def _clean_id(category_id):
+    if category_id is None or pd.isna(category_id):
+        return None
+    try:
+        return int(float(category_id))
+    except (TypeError, ValueError):
+        return str(category_id)
+
+
+CATEGORY_DICTIONARY = CategoryDictionary()
@@ -0,0 +1,52 @@
+import json
+
+import pandas as pd
+
+from src.mappers.categories import CATEGORY_DICTIONARY
+
+ENCODED_COLUMNS = ["categories", "images"]
+# Merged columns whose Woo REST field has another name.
+WOO_FIELDS = {"stock": "stock_quantity"}
+
+
+def build_payloads(products_df: pd.DataFrame, woo_ids=None) -> list:
+    """
+    Builds the Woo shaped product payloads for a batch.
+    This is the only place where the category codes and image urls are
+    turned into the `[{"id": ..}]` and `[{"src": ..}]` lists,
+    woo_ids being the categories resolved in the target store.
+    """
+    plain_columns = [
+        column
+        for column in products_df.columns
+        if column not in ENCODED_COLUMNS
+    ]
+    payloads = json.loads(
+        products_df[plain_columns]
+        .rename(columns=WOO_FIELDS)
+        .assign(manage_stock=True)
+        .to_json(orient="records")
+    )
+    if "categories" in products_df:
+        for payload, codes in zip(payloads, products_df["categories"]):
+            payload["categories"] = CATEGORY_DICTIONARY.decode(
+                codes, woo_ids=woo_ids
+            )
+    if "images" in products_df:
+        for payload, image in zip(payloads, products_df["images"]):
+            if isinstance(image, str) and image:
+                payload["images"] = [{"src": image}]
+    return payloads
+
+
+def build_light_payloads(products_df: pd.DataFrame) -> list:
+    """
+    Builds the stock and price only update payloads, used for products
+    whose content did not change since it was last pushed.
+    """
+    light_df = (
+        products_df[["id", "regular_price", "stock"]]
+        .rename(columns=WOO_FIELDS)
+        .assign(manage_stock=True)
+    )
+    return json.loads(light_df.to_json(orient="records"))
@@ -0,0 +1,1255 @@
+import asyncio
+import json
+import pickle
+import time
+import traceback
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from src.connectors.artifact_connector import ArtifactConnector
+from src.connectors.cache_connector import CacheConnector
+from src.connectors.config_connector import ConfigConnector
+from src.connectors.file_connector import FileConnector
+from src.connectors.woo_connector import WooConnector
+from src.logging.logger import get_module_logger
+from src.mappers import FINAL_COLUMNS, map_products
+from src.mappers.categories import CATEGORY_DICTIONARY, CategoryIndex
+from src.mappers.payloads import build_light_payloads, build_payloads
+from src.settings import Config
+from src.skus import build_sku_filter
+from src.sync.checkpoint import PushJournal, get_accepted_skus, hash_batch
+from src.sync.content import ContentState
+from src.sync.fingerprint import save_run_fingerprint
+from src.sync.images import ImageState
+from src.sync.shards import get_shard_namespace, in_shard
+from src.sync.snapshot import (
+    get_snapshot_name,
+    set_snapshot_layout,
+    write_snapshot,
+)
+from src.sync.sources import SourceCache
+from src.sync.stores import (
+    DEFAULT_BOT_TAG_ID,
+    get_store_credentials,
+    get_stores,
+)
+
+logger = get_module_logger(__name__)
+BATCH_SIZE = 100
+SKU_FILTER_CACHE = "sku_filter.bin"
+SKU_FILTER_METADATA = "sku_filter.json"
+# Inputs the shard coordinator loads once per store for all of its workers.
+SHARD_SKU_FILTER_CACHE = "shard_sku_filter.bin"
+SHARD_CATALOGUE_CACHE = "shard_catalogue.pkl"
+
+# In memory state that only outlives a run in daemon mode, where the process
+# stays resident between runs.
+WARM_CACHE = {"sku_filters": {}, "sources": {}, "catalogues": {}}
+
+# Merged columns every store prices its products from, never pushed.
+PRICE_COLUMNS = ["base_price", "applied_tax", "price_source"]
+
+
+async def main(run_fingerprint=None, shard=None, run_id=None):
+    """
+    Main handler for the Puller.
+    Gets all new products and pushes them into Woo
+    :param run_fingerprint: fingerprint of the run inputs, stored once the
+        run is confirmed so the next identical run can be skipped.
+    :param shard: (index, count) of the shard to run. A shard only merges
+        and pushes its own skus, from the sources prepared by the shard
+        coordinator, which also owns last_check.
+    :param run_id: id of the sharded run the shard belongs to, the
+        artifacts of its shards are kept together.
+    :return: the run timings, in seconds per stage, and whether the run
+        completed.
+    """
+    started_at = time.time()
+    timings = {"started_at": started_at, "stages": {}, "complete": False}
+    stage_started = time.perf_counter()
+
+    artifact_connector = None
+    try:
+        config_connector = ConfigConnector()
+        config = config_connector.get_config()
+        artifact_connector = ArtifactConnector(
+            config=config,
+            run_id=run_id,
+            part=get_snapshot_name(shard) if shard is not None else None,
+        )
+        dryrun = config.get("dryrun", True)
+        use_local = config.get("use_local", False)
+        cleanup = config.get("cleanup", True)
+        str_last_check = config.get("last_check", "")
+        logger.info(msg="")
+        if dryrun:
+            logger.info(msg="Starting Puller in dryrun.")
+        else:
+            logger.info(msg="Starting Puller.")
+        logger.info(msg="")
+        if str_last_check:
+            last_check = str_last_check
+        else:
+            last_check = (
+                datetime.now(pytz.timezone("UTC"))
+                .replace(hour=0, minute=0, second=0, microsecond=0)
+                .astimezone(pytz.utc)
+                .strftime(Config.DATE_FORMAT)
+            )
+
+        now = (
+            datetime.now(pytz.timezone("UTC"))
+            .astimezone(pytz.utc)
+            .strftime(Config.DATE_FORMAT)
+        )
+        logger.info(msg=f"Last check: {last_check}")
+        logger.info(msg=f"Current check: {now}")
+
+        stores = get_stores(config)
+        # Every source is ingested once, for the whitelists of every store.
+        if shard is not None:
+            logger.info(msg=f"Running shard {shard[0]} of {shard[1]}.")
+            store_filters = await asyncio.to_thread(
+                load_shard_filters, stores=stores, shard=shard
+            )
+        else:
+            store_filters = await asyncio.to_thread(
+                load_store_filters, stores=stores
+            )
+        sku_filter = np.unique(np.concatenate(list(store_filters.values())))
+        stage_started = _record_timing(timings, "sku_filter", stage_started)
+
+        store_pushes = []
+        if not dryrun:
+            for store_name, store_config in stores:
+                woo_connector = WooConnector(
+                    **get_store_credentials(store_name, store_config)
+                )
+                if shard is not None:
+                    catalogue = asyncio.to_thread(
+                        load_shard_catalogue,
+                        store_name=store_name,
+                        shard=shard,
+                    )
+                else:
+                    catalogue = asyncio.to_thread(
+                        fetch_catalogue,
+                        woo_connector=woo_connector,
+                        config=store_config,
+                        store_name=store_name,
+                    )
+                existing_products_task = asyncio.create_task(catalogue)
+                store_pushes.append(
+                    (
+                        store_name,
+                        store_config,
+                        woo_connector,
+                        existing_products_task,
+                    )
+                )
+
+        all_products_df = await ingest_all_sources(
+            config=config,
+            sku_filter=sku_filter,
+            download=not use_local,
+            prepared=shard is not None,
+            snapshot_name=get_snapshot_name(shard),
+            artifact_connector=artifact_connector,
+        )
+        timings["products"] = len(all_products_df)
+        logger.info(msg="---- Mapping products is done.")
+        stage_started = _record_timing(timings, "ingestion", stage_started)
+        if not dryrun:
+            completed = await asyncio.gather(
+                *[
+                    push_to_store(
+                        all_products_df=all_products_df,
+                        store_name=store_name,
+                        store_config=store_config,
+                        sku_filter=store_filters[store_name],
+                        woo_connector=woo_connector,
+                        existing_products_task=existing_products_task,
+                        config=config,
+                        shard=shard,
+                        artifact_connector=artifact_connector,
+                    )
+                    for (
+                        store_name,
+                        store_config,
+                        woo_connector,
+                        existing_products_task,
+                    ) in store_pushes
+                ]
+            )
+
+            timings["complete"] = all(completed)
+            if timings["complete"] and shard is not None:
+                logger.info(msg="---- Shard pushed every batch.")
+            elif timings["complete"]:
+                logger.info(msg="---- Writing updated config.")
+                config["last_check"] = now
+                config_connector.set_config(config)
+                if run_fingerprint:
+                    save_run_fingerprint(
+                        cache_connector=CacheConnector(),
+                        fingerprint=run_fingerprint,
+                    )
+            else:
+                logger.warning(
+                    msg="Woo did not confirm every batch, keeping last_check "
+                    "until the next run resumes them."
+                )
+            _record_timing(timings, "push", stage_started)
+        else:
+            artifact_connector.write_df("all_products", all_products_df)
+            timings["complete"] = True
+
+    except Exception as error:
+        tb = traceback.format_exc()
+        error_message = (
+            f"Unexpected error while processing data. \n"
+            f"Error: {error}. \n"
+            f"Traceback: {tb}"
+        )
+        logger.error(msg=error_message)
+    finally:
+        # Shards leave the local sources to their coordinator.
+        if cleanup and shard is None:
+            delete_all_local_sources(config=config)
+        if artifact_connector:
+            artifact_connector.close()
+    logger.info(msg="")
+    logger.info(msg="---- Puller finished")
+    logger.info(msg="")
+    timings["total"] = round(time.time() - started_at, 3)
+    return timings
+
+
+def _record_timing(timings, stage, stage_started):
+    stage_ended = time.perf_counter()
+    timings["stages"][stage] = round(stage_ended - stage_started, 3)
+    return stage_ended
+
+
+def load_store_filters(stores) -> dict:
+    """
+    Loads the SKU whitelist of every store, keyed by store name.
+    """
+    return {
+        store_name: load_sku_filter(
+            config=store_config,
+            cache_connector=CacheConnector(namespace=store_name),
+        )
+        for store_name, store_config in stores
+    }
+
+
+def prepare_shard_inputs(config):
+    """
+    Loads what the shard workers of a run share, once for all of them: the
+    whitelist of every store and, outside dryrun, its Woo catalogue and
+    category index, into the store cache the workers read them from.
+    """
+    stores = get_stores(config)
+    store_filters = load_store_filters(stores=stores)
+    for store_name, store_config in stores:
+        cache_connector = CacheConnector(namespace=store_name)
+        cache_connector.set_bytes(
+            SHARD_SKU_FILTER_CACHE, store_filters[store_name].tobytes()
+        )
+        if config.get("dryrun", True):
+            continue
+        woo_connector = WooConnector(
+            **get_store_credentials(store_name, store_config)
+        )
+        catalogue_df = fetch_catalogue(
+            woo_connector=woo_connector,
+            config=store_config,
+            store_name=store_name,
+        )
+        cache_connector.set_bytes(
+            SHARD_CATALOGUE_CACHE, pickle.dumps(catalogue_df)
+        )
+        category_index = CategoryIndex(
+            woo_connector=woo_connector,
+            cache_connector=cache_connector,
+            config=store_config,
+        )
+        category_index.refresh()
+        category_index.save()
+
+
+def load_shard_filters(stores, shard) -> dict:
+    """
+    The whitelist skus of every store that belong to the shard, from the
+    filters prepared by the shard coordinator.
+    """
+    store_filters = {}
+    for store_name, _ in stores:
+        content = CacheConnector(namespace=store_name).get_bytes(
+            SHARD_SKU_FILTER_CACHE
+        )
+        if content is None:
+            raise ValueError(
+                f"No prepared SKU filter for the {store_name or 'default'} "
+                f"store, start the coordinator first."
+            )
+        store_filter = np.frombuffer(content, dtype=np.int64)
+        store_filters[store_name] = store_filter[in_shard(store_filter, shard)]
+    return store_filters
+
+
+def load_shard_catalogue(store_name, shard) -> pd.DataFrame:
+    """
+    The Woo catalogue products of a store that belong to the shard, from
+    the catalogue fetched by the shard coordinator.
+    """
+    content = CacheConnector(namespace=store_name).get_bytes(
+        SHARD_CATALOGUE_CACHE
+    )
+    if content is None:
+        raise ValueError(
+            f"No prepared catalogue for the {store_name or 'default'} store, "
+            f"start the coordinator first."
+        )
+    catalogue_df = pickle.loads(content)
+    return catalogue_df[in_shard(catalogue_df.sku, shard)].reset_index(
+        drop=True
+    )
+
+
+def load_sku_filter(config, cache_connector=None):
+    """
+    Loads the SKU whitelist as a sorted int64 array of EANs.
+    The sheet is cached locally and only revalidated once `skus_cache_ttl`
+    seconds have passed. If the sheet can not be fetched, the last good copy
+    is used instead of aborting the run.
+    """
+    doc_url = config.get("skus_doc_url")
+    sheet_name = config.get("skus_doc_sheet_name").replace(" ", "%20")
+    csv_url = f"{doc_url}/export?gid=0&format=csv&sheet={sheet_name}"
+    ttl = config.get("skus_cache_ttl", 3600)
+
+    warm_filter = WARM_CACHE["sku_filters"].get(csv_url)
+    if warm_filter and time.time() - warm_filter["fetched_at"] < ttl:
+        return warm_filter["sku_filter"]
+
+    cache_connector = cache_connector or CacheConnector()
+    cached_filter = cache_connector.get_bytes(SKU_FILTER_CACHE)
+    metadata = cache_connector.get_json(SKU_FILTER_METADATA, default={})
+    if metadata.get("csv_url") != csv_url:
+        cached_filter = None
+        metadata = {"csv_url": csv_url}
+    if cached_filter is not None:
+        age = time.time() - metadata.get("fetched_at", 0)
+        if age < ttl:
+            logger.info(msg=f"Using cached SKU filter ({age:0.0f}s old).")
+            sku_filter = np.frombuffer(cached_filter, dtype=np.int64)
+            WARM_CACHE["sku_filters"][csv_url] = {
+                "fetched_at": metadata["fetched_at"],
+                "sku_filter": sku_filter,
+            }
+            return sku_filter
+
+    try:
+        content, validators = FileConnector().read_url_conditionally(
+            source_url=csv_url,
+            etag=metadata.get("etag") if cached_filter else None,
+            last_modified=(
+                metadata.get("last_modified") if cached_filter else None
+            ),
+        )
+        if content is None:
+            logger.info(msg="SKU filter not modified, using cached copy.")
+            sku_filter = np.frombuffer(cached_filter, dtype=np.int64)
+        else:
+            df = pd.read_csv(
+                BytesIO(content), header=None, on_bad_lines="skip"
+            )
+            sku_filter = build_sku_filter(df[0])
+            cache_connector.set_bytes(SKU_FILTER_CACHE, sku_filter.tobytes())
+        metadata.update(validators)
+        metadata["fetched_at"] = time.time()
+        cache_connector.set_json(SKU_FILTER_METADATA, metadata)
+    except Exception as error:
+        if cached_filter is None:
+            raise
+        logger.warning(
+            f"Could not refresh the SKU filter, using last good copy. \n"
+            f"Error: {error}"
+        )
+        sku_filter = np.frombuffer(cached_filter, dtype=np.int64)
+
+    logger.info(msg=f"Loaded {len(sku_filter)} SKUs in the filter.")
+    WARM_CACHE["sku_filters"][csv_url] = {
+        "fetched_at": metadata.get("fetched_at", time.time()),
+        "sku_filter": sku_filter,
+    }
+    return sku_filter
+
+
+async def download_single_source(source, file_connector):
+    use_local = source.get("use_local", False)
+    if not use_local:
+        source_name = source.get("name")
+        active = source.get("active")
+        encoding = source.get("encoding", None)
+        if active:
+            try:
+                logger.info(msg=f"Downloading Source: {source_name}")
+                source_type = source.get("type")
+                source_download_url = source.get("download_url")
+                if source_type == "endpoint":
+                    local_filename = f"{source_name}.csv"
+                    await asyncio.to_thread(
+                        file_connector.read_and_write_file_locally,
+                        source_url=source_download_url,
+                        filename=local_filename,
+                        encoding=encoding,
+                    )
+                elif source_type == "ftp":
+                    file_path = source.get("file_path", None)
+                    user = source.get("user", None)
+                    password = source.get("password", None)
+                    expected_file = source.get("expected_file", None)
+                    if file_path and user and password and expected_file:
+                        await asyncio.to_thread(
+                            file_connector.read_and_write_ftp_locally,
+                            source_url=source_download_url,
+                            file_path=file_path,
+                            filename=source_name,
+                            expected_file=expected_file,
+                            user=user,
+                            password=password,
+                        )
+
+            except Exception as processing_error:
+                logger.error(
+                    f"Error downloading source data for {source_name}.\n"
+                    f"Error: {processing_error}"
+                )
+
+
+async def prepare_sources(config, download=True):
+    """
+    Downloads, parses and maps every due source into the source cache, for
+    the shard workers to merge from without downloading or parsing anything.
+    """
+    file_connector = FileConnector()
+    source_cache = SourceCache(cache_connector=CacheConnector(), config=config)
+    sources = [
+        source for source in config.get("sources", []) if source.get("active")
+    ]
+
+    async def prepare_single_source(source):
+        source_name = source.get("name")
+        if not source_cache.is_due(source):
+            logger.info(f"{source_name} is not due for a refresh.")
+            return
+        if download:
+            await download_single_source(source, file_connector)
+        try:
+            products_df = await asyncio.to_thread(
+                parse_source,
+                source=source,
+                config=config,
+                file_connector=file_connector,
+            )
+            if products_df is not None:
+                await asyncio.to_thread(
+                    source_cache.set, source_name, products_df
+                )
+        except Exception as processing_error:
+            tb = traceback.format_exc()
+            error_message = (
+                f"Error preparing data for {source_name}. \n"
+                f"Error: {processing_error}. \n"
+                f"Traceback: {tb}"
+            )
+            logger.error(error_message)
+
+    await asyncio.gather(
+        *[prepare_single_source(source) for source in sources]
+    )
+    logger.info(msg="---- Preparing sources is done.")
+
+
+async def ingest_all_sources(
+    config,
+    sku_filter,
+    download=True,
+    prepared=False,
+    snapshot_name=None,
+    artifact_connector=None,
+):
+    """
+    Downloads, parses and maps every active source concurrently.
+    Each source is parsed as soon as its own download finishes, and the
+    mapped products reach the merge through a bounded queue.
+    Sources whose `refresh_interval_minutes` did not elapse yet are neither
+    downloaded nor parsed, their last mapped products are merged instead.
+    With `prepared`, every source is taken from the source cache as it was
+    left by prepare_sources. The merge is written to the `snapshot_name`
+    lookup snapshot, when given.
+    """
+    file_connector = FileConnector()
+    source_cache = SourceCache(cache_connector=CacheConnector(), config=config)
+    sources = [
+        source for source in config.get("sources", []) if source.get("active")
+    ]
+    mapped_queue = asyncio.Queue(maxsize=config.get("pipeline_queue_size", 4))
+
+    async def ingest_single_source(source):
+        products_df = None
+        try:
+            if download and not prepared and source_cache.is_due(source):
+                await download_single_source(source, file_connector)
+            products_df = await asyncio.to_thread(
+                load_single_source,
+                source=source,
+                config=config,
+                sku_filter=sku_filter,
+                file_connector=file_connector,
+                source_cache=source_cache,
+                prepared=prepared,
+            )
+        finally:
+            await mapped_queue.put((source.get("name"), products_df))
+        if artifact_connector and products_df is not None:
+            artifact_connector.write_df(
+                f"mapped_{source.get('name')}", products_df
+            )
+
+    tasks = [
+        asyncio.create_task(ingest_single_source(source)) for source in sources
+    ]
+    all_data_sources = {}
+    for _ in sources:
+        source_name, products_df = await mapped_queue.get()
+        if products_df is not None:
+            all_data_sources[source_name] = products_df
+    await asyncio.gather(*tasks)
+    logger.info(msg="---- Downloading and parsing sources is done.")
+
+    # The merge relies on the configured source order, not the arrival one.
+    all_data_sources = {
+        source.get("name"): all_data_sources[source.get("name")]
+        for source in sources
+        if source.get("name") in all_data_sources
+    }
+    merged_df = await asyncio.to_thread(
+        merge_all_sources,
+        all_data_sources=all_data_sources,
+        config=config,
+        snapshot_name=snapshot_name,
+    )
+    if artifact_connector:
+        artifact_connector.write_df("merged", merged_df)
+    return merged_df
+
+
+def load_single_source(
+    source, config, sku_filter, file_connector, source_cache, prepared=False
+):
+    source_name = source.get("name")
+    try:
+        logger.info(msg=f"---- Processing Source: {source_name} ----")
+        products_df = None
+        if prepared:
+            products_df = source_cache.get(source_name)
+            if products_df is None:
+                logger.warning(f"{source_name} was not prepared, skipping it.")
+                return None
+        elif not source_cache.is_due(source):
+            products_df = source_cache.get(source_name)
+            if products_df is not None:
+                logger.info(
+                    f"{source_name} is not due for a refresh, reusing its "
+                    f"{len(products_df)} cached products."
+                )
+        if products_df is None:
+            products_df = parse_source(
+                source=source, config=config, file_connector=file_connector
+            )
+            if products_df is not None:
+                source_cache.set(source_name, products_df)
+        if products_df is not None:
+            products_df = products_df[products_df.stock > 0]
+            logger.info(
+                f"{len(products_df)} products remain from {source_name} after stock filter"
+            )
+            products_df = products_df[products_df["sku"].isin(sku_filter)]
+            logger.info(
+                f"{len(products_df)} products remain from {source_name} after sku filter"
+            )
+            if not products_df.empty:
+                logger.info(
+                    f"Found {len(products_df)} new product updates form {source_name}."
+                )
+            return products_df
+    except Exception as processing_error:
+        tb = traceback.format_exc()
+        error_message = (
+            f"Error processing data for {source_name}. \n"
+            f"Error: {processing_error}. \n"
+            f"Traceback: {tb}"
+        )
+        logger.error(error_message)
+    return None
+
+
+def parse_source(source, config, file_connector):
+    """
+    Reads and maps the local file of a source.
+    The mapped products are kept warm in memory, keyed by the content hash
+    of the file and the settings the mapping depends on, so a resident
+    process does not parse an unchanged file twice, even when it was
+    downloaded again.
+    """
+    source_name = source.get("name")
+    local_filename = f"{source_name}.csv"
+    file_hash = file_connector.hash_local_file(local_filename)
+    parse_key = None
+    if file_hash:
+        parse_key = json.dumps(
+            [source, file_hash, config.get("tax"), config.get("strict_ean")],
+            sort_keys=True,
+        )
+    warm_source = WARM_CACHE["sources"].get(source_name)
+    if parse_key and warm_source and warm_source["parse_key"] == parse_key:
+        logger.info(f"Reusing the already parsed {source_name} products.")
+        return warm_source["products_df"]
+
+    separator = source.get("separator", ";")
+    header = source.get("header", None)
+    names = source.get("names", None)
+    engine = source.get("engine", "python")
+    if source_name == "ingrammicro":
+        names = [str(x) for x in range(28)]
+    encoding = source.get("encoding", None)
+    file_encoding = "ISO-8859-1" if encoding else "utf-8"
+    products_df = file_connector.get_file_df(
+        filename=local_filename,
+        encoding=file_encoding,
+        separator=separator,
+        header=header,
+        names=names,
+        engine=engine,
+    )
+    if products_df is None:
+        return None
+    logger.info(
+        f"Got {len(products_df)} products from {source_name} before mapping"
+    )
+    products_df = map_products(
+        source=source_name,
+        products_df=products_df,
+        config=config,
+    )
+    if products_df is None:
+        return None
+    logger.info(
+        f"{len(products_df)} products remain from {source_name} after initial mapping"
+    )
+    if parse_key:
+        WARM_CACHE["sources"][source_name] = {
+            "parse_key": parse_key,
+            "products_df": products_df,
+        }
+    return products_df
+
+
+def fetch_catalogue(woo_connector, config, store_name=None):
+    """
+    Gets the Woo catalogue of a store. With a warm snapshot, only the
+    products modified since it was taken are fetched, and the whole catalogue
+    is fetched again every `catalogue_full_refresh_minutes` to drop deleted
+    products.
+    """
+    fetched_at = (datetime.now(pytz.utc) - timedelta(minutes=1)).strftime(
+        "%Y-%m-%dT%H:%M:%S"
+    )
+    snapshot = WARM_CACHE["catalogues"].get(store_name)
+    bot_tag_id = config.get("bot_tag_id", DEFAULT_BOT_TAG_ID)
+    full_refresh = config.get("catalogue_full_refresh_minutes", 60) * 60
+    if (
+        snapshot is None
+        or snapshot["bot_tag_id"] != bot_tag_id
+        or time.time() - snapshot["full_at"] >= full_refresh
+    ):
+        products_df = woo_connector.get_products_df(bot_tag_id=bot_tag_id)
+        full_at = time.time()
+    else:
+        changed_df = woo_connector.get_products_df(
+            modified_after=snapshot["fetched_at"], bot_tag_id=bot_tag_id
+        )
+        logger.info(
+            f"{len(changed_df)} products changed in Woo since last run."
+        )
+        products_df = snapshot["products_df"]
+        if not changed_df.empty:
+            products_df = pd.concat(
+                [
+                    products_df[~products_df["id"].isin(changed_df["id"])],
+                    changed_df,
+                ],
+                ignore_index=True,
+            )
+        full_at = snapshot["full_at"]
+    WARM_CACHE["catalogues"][store_name] = {
+        "products_df": products_df,
+        "fetched_at": fetched_at,
+        "full_at": full_at,
+        "bot_tag_id": bot_tag_id,
+    }
+    return products_df.copy()
+
+
+def merge_all_sources(all_data_sources, config, snapshot_name=None):
+    unique_skus = {
+        sku
+        for products_df in all_data_sources.values()
+        for sku in products_df["sku"]
+    }
+    logger.info(
+        f"{len(unique_skus)} unique products remain after looking at all sources. \n"
+        f"Starting the merge process."
+    )
+
+    candidates_df = get_candidates(all_data_sources=all_data_sources)
+    final_df = merge_sources(candidates_df=candidates_df, config=config)
+    if snapshot_name and config.get("snapshot_enabled", True):
+        save_snapshot(
+            candidates_df=candidates_df,
+            products_df=final_df,
+            config=config,
+            snapshot_name=snapshot_name,
+        )
+
+    if final_df is not None:
+        treated_all_products_df = treat_all_products_df(
+            all_products_df=final_df
+        )
+    else:
+        treated_all_products_df = final_df
+
+    logger.info(
+        f"{len(treated_all_products_df)} unique products remain after merge of all sources."
+    )
+    return treated_all_products_df
+
+
+def get_candidates(all_data_sources) -> pd.DataFrame:
+    """
+    Every offer of every source in a single frame, one row per source and
+    sku, tagged with its source and the order the source is configured in.
+    """
+    candidates_df = pd.concat(
+        [
+            products_df.assign(source=source_name, source_order=source_order)
+            for source_order, (source_name, products_df) in enumerate(
+                all_data_sources.items()
+            )
+        ]
+        or [pd.DataFrame(columns=FINAL_COLUMNS + ["source", "source_order"])],
+        ignore_index=True,
+    )
+    if "applied_tax" not in candidates_df:
+        # Sources cached before the mappers recorded the tax they applied.
+        candidates_df["applied_tax"] = np.nan
+    candidates_df = candidates_df.drop_duplicates(["source", "sku"])
+    candidates_df["regular_price"] = pd.to_numeric(
+        candidates_df["regular_price"], errors="coerce"
+    )
+    return candidates_df
+
+
+def merge_sources(candidates_df, config) -> pd.DataFrame:
+    """
+    Merges the candidate offers of every source into one row per sku.
+    Price, stock and categories come from the cheapest source, while name,
+    description and images follow the source priorities in `defaults`.
+    The cheapest price is also kept before the markup, in the PRICE_COLUMNS
+    each store prices its products from.
+    All lookups are integer keyed group operations over the int64 skus.
+    """
+    defaults = config.get("defaults", {})
+    differential_price = config.get("differential_price", {})
+
+    final_df = pd.DataFrame(columns=FINAL_COLUMNS)
+    final_df["sku"] = candidates_df["sku"].drop_duplicates().to_numpy()
+
+    min_prices = candidates_df.groupby("sku")["regular_price"].transform("min")
+    cheapest_df = (
+        candidates_df[candidates_df["regular_price"] == min_prices]
+        .drop_duplicates("sku", keep="last")
+        .set_index("sku")
+    )
+    cheapest = cheapest_df.reindex(final_df["sku"])
+
+    final_df["name"] = (
+        _pick_by_priority(
+            candidates_df, "name", defaults.get("name", ["source"])
+        )
+        .reindex(final_df["sku"])
+        .to_numpy()
+    )
+    final_df["description"] = (
+        _pick_by_priority(
+            candidates_df,
+            "description",
+            defaults.get("description", ["source"]),
+        )
+        .reindex(final_df["sku"])
+        .to_numpy()
+    )
+    final_df["stock"] = cheapest["stock"].fillna(0).to_numpy()
+    final_df["categories"] = [
+        categories if isinstance(categories, tuple) else ()
+        for categories in cheapest["categories"]
+    ]
+    final_df["regular_price"] = _apply_differential_price(
+        cheapest["regular_price"], differential_price
+    ).to_numpy()
+    final_df["images"] = (
+        _pick_by_priority(
+            candidates_df, "images", defaults.get("images", ["source"])
+        )
+        .reindex(final_df["sku"])
+        .to_numpy()
+    )
+    final_df["images"] = final_df["images"].astype("category")
+    final_df["base_price"] = cheapest["regular_price"].to_numpy()
+    final_df["applied_tax"] = cheapest["applied_tax"].to_numpy()
+    final_df["price_source"] = cheapest["source"].to_numpy()
+    return final_df
+
+
+def save_snapshot(candidates_df, products_df, config, snapshot_name):
+    """
+    Writes the lookup snapshot of the merge, with the price every store
+    would sell each product at. A snapshot that can not be written never
+    fails the run. Sharded runs have their layout set by the coordinator.
+    """
+    try:
+        cache_connector = CacheConnector()
+        if snapshot_name == get_snapshot_name():
+            set_snapshot_layout(cache_connector, [snapshot_name])
+        write_snapshot(
+            cache_connector=cache_connector,
+            name=snapshot_name,
+            candidates_df=candidates_df,
+            products_df=products_df,
+            store_prices={
+                store_name
+                or "default": price_for_store(
+                    products_df=products_df,
+                    store_config=store_config,
+                    config=config,
+                )["regular_price"]
+                for store_name, store_config in get_stores(config)
+            },
+        )
+    except Exception as error:
+        logger.warning(f"Could not write the lookup snapshot. {error}")
+
+
+def _pick_by_priority(candidates_df, column, priorities) -> pd.Series:
+    """
+    Value of `column` per sku, taken from the first source in `priorities`
+    that has a value for it. The "source" priority stands for any source,
+    in the order they are configured.
+    """
+    ranks = candidates_df["source"].map(
+        {
+            source_name: rank
+            for rank, source_name in enumerate(priorities)
+            if source_name != "source"
+        }
+    )
+    if "source" in priorities:
+        ranks = ranks.fillna(priorities.index("source"))
+    has_value = candidates_df[column].notna() & (
+        candidates_df[column].astype(str) != ""
+    )
+    ranked_df = candidates_df.assign(rank=ranks)[has_value & ranks.notna()]
+    ranked_df = ranked_df.sort_values(["rank", "source_order"], kind="stable")
+    return ranked_df.drop_duplicates("sku").set_index("sku")[column]
+
+
+def _apply_differential_price(prices, differential_price) -> pd.Series:
+    """
+    Applies the first `differential_price` multiplier whose range upper bound
+    covers the price, "inf" covering every remaining price.
+    """
+    final_prices = prices.copy()
+    pending = pd.Series(True, index=prices.index)
+    for price_range, multiplier in differential_price.items():
+        if price_range == "inf":
+            matches = pending
+        else:
+            matches = pending & (prices <= int(price_range))
+        final_prices[matches] = prices[matches] * multiplier
+        pending &= ~matches
+    return final_prices
+
+
+def treat_all_products_df(all_products_df: pd.DataFrame) -> pd.DataFrame:
+    all_products_df["stock"] = pd.to_numeric(all_products_df["stock"])
+
+    default_tags_to_add = [{"id": 790}]
+    columns_to_drop = ["source"]
+
+    all_products_df["tags"] = [default_tags_to_add] * len(all_products_df)
+    all_products_df["status"] = "pending"
+    # all_products_df_filtered.drop(columns_to_drop, axis=1, inplace=True)
+    return all_products_df
+
+
+async def push_to_store(
+    all_products_df: pd.DataFrame,
+    store_name,
+    store_config,
+    sku_filter,
+    woo_connector,
+    existing_products_task,
+    config,
+    shard=None,
+    artifact_connector=None,
+):
+    """
+    Pushes the merged products whitelisted by a store into it, priced with
+    the store markup. Every store keeps its own caches and push journal, so
+    a store failing never holds the others back.
+    Returns whether the store confirmed every batch.
+    """
+    store_label = store_name or "default"
+    try:
+        cache_connector = CacheConnector(
+            namespace=get_shard_namespace(store_name, shard)
+        )
+        push_journal = PushJournal(cache_connector=cache_connector)
+        store_products_df = price_for_store(
+            products_df=all_products_df[all_products_df.sku.isin(sku_filter)],
+            store_config=store_config,
+            config=config,
+        )
+        logger.info(
+            f"---- Pushing {len(store_products_df)} products to the "
+            f"{store_label} store."
+        )
+        complete = await send_products_to_woo(
+            all_new_products_df=store_products_df,
+            config=store_config,
+            woo_connector=woo_connector,
+            existing_products_task=existing_products_task,
+            push_journal=push_journal,
+            cache_connector=cache_connector,
+            # The category ids are the same for every shard of a store.
+            category_cache_connector=CacheConnector(namespace=store_name),
+            artifact_connector=artifact_connector,
+            artifact_name=(
+                f"payloads_{store_name}" if store_name else "payloads"
+            ),
+        )
+        if complete:
+            push_journal.complete()
+        else:
+            logger.warning(
+                f"The {store_label} store did not confirm every batch."
+            )
+        return complete
+    except Exception as error:
+        tb = traceback.format_exc()
+        error_message = (
+            f"Unexpected error while pushing to the {store_label} store. \n"
+            f"Error: {error}. \n"
+            f"Traceback: {tb}"
+        )
+        logger.error(msg=error_message)
+        return False
+
+
+def price_for_store(products_df: pd.DataFrame, store_config, config):
+    """
+    The merged products as a store sells them: priced from the cheapest
+    supplier price with the store `tax` and `differential_price`, and
+    tagged with the store `bot_tag_id`.
+    """
+    prices = products_df["base_price"]
+    store_tax = store_config.get("tax")
+    if store_tax != config.get("tax"):
+        # Only the prices the mappers taxed are taxed again, supplier prices
+        # that already included the tax stay as they are.
+        prices = prices * (store_tax / products_df["applied_tax"]).fillna(1.0)
+    bot_tag_id = store_config.get("bot_tag_id", DEFAULT_BOT_TAG_ID)
+    return products_df.drop(columns=PRICE_COLUMNS).assign(
+        regular_price=_apply_differential_price(
+            prices, store_config.get("differential_price", {})
+        ),
+        tags=[[{"id": bot_tag_id}]] * len(products_df),
+    )
+
+
+async def send_products_to_woo(
+    all_new_products_df: pd.DataFrame,
+    config,
+    woo_connector,
+    existing_products_task,
+    push_journal,
+    cache_connector=None,
+    category_cache_connector=None,
+    artifact_connector=None,
+    artifact_name="payloads",
+):
+    """
+    Pushes the merged products into a Woo store. The Woo catalogue is
+    fetched by existing_products_task, which runs concurrently with the
+    ingestion. cache_connector holds the state of the store, and
+    category_cache_connector its category index when kept apart from it.
+    Returns whether Woo confirmed every batch.
+    """
+    cache_connector = cache_connector or CacheConnector()
+    category_cache_connector = category_cache_connector or cache_connector
+    if not all_new_products_df.empty:
+        logger.info(
+            f"Finished processing everything. Got a total of {len(all_new_products_df)} products."
+        )
+        category_codes = {
+            code
+            for codes in all_new_products_df["categories"]
+            for code in codes
+        }
+        category_index = CategoryIndex(
+            woo_connector=woo_connector,
+            cache_connector=category_cache_connector,
+            config=config,
+        )
+        category_ids, all_existing_products_df = await asyncio.gather(
+            asyncio.to_thread(
+                category_index.resolve, CATEGORY_DICTIONARY, category_codes
+            ),
+            existing_products_task,
+        )
+        products_with_manual_override = all_existing_products_df[
+            ~all_existing_products_df["bot"]
+        ]
+
+        products_to_be_updated = all_new_products_df[
+            all_new_products_df.sku.isin(all_existing_products_df.sku)
+        ]
+        products_to_be_updated = products_to_be_updated[
+            ~products_to_be_updated.sku.isin(products_with_manual_override.sku)
+        ]
+        products_to_be_created = all_new_products_df[
+            ~all_new_products_df.sku.isin(all_existing_products_df.sku)
+        ]
+
+        woo_ids = all_existing_products_df.drop_duplicates("sku").set_index(
+            "sku"
+        )["id"]
+        products_to_be_updated = products_to_be_updated.assign(
+            id=woo_ids.reindex(products_to_be_updated.sku).to_numpy()
+        )
+        content_state = ContentState(
+            cache_connector=cache_connector, config=config
+        )
+        full_updates, light_updates = content_state.split(
+            products_df=products_to_be_updated
+        )
+
+        if not products_to_be_updated.empty:
+            logger.info(
+                f"Will send {len(products_to_be_updated)} product updates to woo, "
+                f"{len(light_updates)} of them stock and price only."
+            )
+        if not products_to_be_created.empty:
+            logger.info(
+                f"Will send {len(products_to_be_created)} new products to woo."
+            )
+        image_state = ImageState(
+            cache_connector=cache_connector,
+            file_connector=FileConnector(),
+            config=config,
+        )
+        results = await _batch_products(
+            products_by_verb=[
+                ("update", light_updates, build_light_payloads),
+                (
+                    "update",
+                    full_updates,
+                    lambda batch: image_state.apply(
+                        build_payloads(batch, woo_ids=category_ids),
+                        verb="update",
+                    ),
+                ),
+                (
+                    "create",
+                    products_to_be_created,
+                    lambda batch: image_state.apply(
+                        build_payloads(batch, woo_ids=category_ids),
+                        verb="create",
+                    ),
+                ),
+            ],
+            woo_connector=woo_connector,
+            config=config,
+            on_success=image_state.record,
+            journal=push_journal,
+            artifact_connector=artifact_connector,
+            artifact_name=artifact_name,
+        )
+        image_state.save()
+        content_state.commit(
+            pushed_skus=[
+                sku
+                for result in results
+                if result["build"] is not build_light_payloads
+                for sku in result["accepted"]
+            ],
+            all_pushed=all(result["ok"] for result in results),
+        )
+
+        logger.info(f"Finished sending products to woo.")
+        return all(result["ok"] for result in results)
+    return True
+
+
+async def _batch_products(
+    products_by_verb,
+    woo_connector,
+    config,
+    on_success=None,
+    journal=None,
+    artifact_connector=None,
+    artifact_name="payloads",
+):
+    """
+    Streams the payload batches through a bounded queue into
+    `push_concurrency` workers, so the next payloads are built while the
+    previous batches are still being pushed.
+    products_by_verb holds (verb, products_df, build) tuples, build being the
+    function that turns a batch into its payloads.
+    on_success is called with the verb and Woo response of every accepted
+    batch. Every answered batch is recorded in the journal, and batches it
+    already confirmed are not pushed again.
+    Returns one result per batch with its skus, whether Woo accepted it and
+    the skus of the items Woo accepted, since a batch Woo answers with 200
+    may still carry failed items.
+    """
+    concurrency = config.get("push_concurrency", 2)
+    batch_queue = asyncio.Queue(maxsize=concurrency * 2)
+    results = []
+
+    async def push_worker():
+        while True:
+            batch = await batch_queue.get()
+            if batch is None:
+                return
+            verb, skus, build, payloads, batch_hash = batch
+            ok = False
+            accepted = []
+            status_code = None
+            try:
+                result = await asyncio.to_thread(
+                    woo_connector.batch_push_product,
+                    products=payloads,
+                    verb=verb,
+                )
+                status_code = result.status_code
+                if result.ok:
+                    response = result.json()
+                    accepted = get_accepted_skus(skus, response.get(verb, []))
+                    # A batch with failed items is pushed again on resume.
+                    ok = len(accepted) == len(skus)
+                    if on_success:
+                        on_success(verb, response)
+                else:
+                    logger.error(
+                        f"Error pushing a batch of {len(payloads)} products "
+                        f"({verb}). {result.status_code} {result.reason}"
+                    )
+            except Exception as push_error:
+                logger.error(
+                    f"Error pushing a batch of {len(payloads)} products "
+                    f"({verb}).\n"
+                    f"Error: {push_error}"
+                )
+            try:
+                if journal:
+                    journal.record(
+                        verb=verb,
+                        skus=skus,
+                        batch_hash=batch_hash,
+                        ok=ok,
+                        status_code=status_code,
+                        failed_skus=sorted(set(skus) - set(accepted)),
+                    )
+            except Exception as journal_error:
+                logger.error(
+                    f"Error recording a batch of {len(payloads)} products "
+                    f"({verb}) in the push journal.\n"
+                    f"Error: {journal_error}"
+                )
+            results.append(
+                {
+                    "verb": verb,
+                    "skus": skus,
+                    "build": build,
+                    "ok": ok,
+                    "accepted": accepted,
+                }
+            )
+
+    workers = [asyncio.create_task(push_worker()) for _ in range(concurrency)]
+    try:
+        for verb, products_df, build in products_by_verb:
+            products_df = products_df.reset_index(drop=True)
+            for start in range(0, len(products_df), BATCH_SIZE):
+                batch = products_df.iloc[start : start + BATCH_SIZE]
+                skus = batch["sku"].tolist()
+                payloads = await asyncio.to_thread(build, batch)
+                if artifact_connector:
+                    artifact_connector.append_json_lines(
+                        f"{artifact_name}_{verb}", payloads
+                    )
+                batch_hash = hash_batch(verb, payloads)
+                if journal and journal.is_confirmed(batch_hash):
+                    results.append(
+                        {
+                            "verb": verb,
+                            "skus": skus,
+                            "build": build,
+                            "ok": True,
+                            "accepted": skus,
+                        }
+                    )
+                    continue
+                await batch_queue.put(
+                    (verb, skus, build, payloads, batch_hash)
+                )
+        for _ in workers:
+            await batch_queue.put(None)
+        await asyncio.gather(*workers)
+    except BaseException:
+        # Workers waiting on an empty queue would never return otherwise.
+        for worker in workers:
+            worker.cancel()
+        raise
+    return results
+
+
+def delete_all_local_sources(config):
+    file_connector = FileConnector()
+    sources = config.get("sources", [])
+    for source in sources:
+        source_name = source.get("name")
+        active = source.get("active")
+        if active:
+            logger.info(msg=f"Processing Source: {source_name}")
+            local_filename = f"{source_name}.csv"
+            file_connector.delete_local_file(filename=local_filename)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """Application configuration."""
+
 import os
 import pathlib
 
@@ -18,10 +19,14 @@ class Config:
 
     LOG_LEVEL = os.getenv("LOG_LEVEL")
     LOG_FILE_NAME = os.getenv("LOG_FILE_NAME")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
 
     DATE_FORMAT = os.getenv("DATE_FORMAT")
 
     CONFIG_FILE = os.getenv("CONFIG_FILE")
+    CACHE_FOLDER = os.getenv("CACHE_FOLDER", "cache")
 
     FTP_HOSTNAME = os.getenv("FTP_HOSTNAME")
     FTP_USERNAME = os.getenv("FTP_USERNAME")
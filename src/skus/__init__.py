@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+INVALID_SKU = -1
+EAN_LENGTHS = (8, 12, 13, 14)
+
+
+def normalize_skus(skus: pd.Series) -> pd.Series:
+    """
+    Normalizes raw SKU values (str, float or int) into int64 EAN keys, so
+    the whitelist, every source and Woo compare the exact same values.
+    Whitespace, `.0` suffixes and leading zeros are dropped, which also makes
+    a UPC-12 and its zero padded EAN-13 the same key.
+    Values that are not numeric codes, or all zeros, are returned as
+    INVALID_SKU.
+    """
+    if not pd.api.types.is_integer_dtype(skus.dtype):
+        skus = (
+            skus.astype(str).str.strip().str.replace(r"\.0+$", "", regex=True)
+        )
+        skus = skus.where(skus.str.fullmatch(r"\d{1,18}"), str(INVALID_SKU))
+    skus = skus.astype(np.int64)
+    return skus.where(skus > 0, INVALID_SKU)
+
+
+def has_valid_checksum(skus: pd.Series) -> pd.Series:
+    """
+    Vectorized GTIN mod 10 check digit validation over int64 EAN keys.
+    Keys are validated at their canonical (unpadded) length, as leading
+    zeros never change the check digit.
+    """
+    remaining = np.clip(skus.to_numpy(dtype=np.int64), 0, None)
+    check_digits = remaining % 10
+    remaining //= 10
+    total = np.zeros(len(remaining), dtype=np.int64)
+    weight = 3
+    while remaining.any():
+        total += (remaining % 10) * weight
+        remaining //= 10
+        weight = 4 - weight
+    in_range = (skus > 0) & (skus < 10 ** max(EAN_LENGTHS))
+    valid = (check_digits == (10 - total % 10) % 10) & in_range.to_numpy()
+    return pd.Series(valid, index=skus.index)
+
+
+def to_ean_keys(skus: pd.Series, strict: bool = False) -> pd.Series:
+    """
+    Canonical EAN keys for a raw SKU column. Unparseable values become
+    INVALID_SKU, as do codes failing the check digit when `strict` is set.
+    """
+    skus = normalize_skus(skus)
+    if strict:
+        skus = skus.where(has_valid_checksum(skus), INVALID_SKU)
+    return skus
+
+
+def build_sku_filter(skus: pd.Series) -> np.ndarray:
+    """
+    Builds the compact whitelist: a sorted, de-duplicated int64 array.
+    """
+    skus = normalize_skus(skus)
+    return np.unique(skus[skus != INVALID_SKU].to_numpy(dtype=np.int64))
@@ -0,0 +1,77 @@
+import hashlib
+import json
+
+from src.logging.logger import get_module_logger
+
+logger = get_module_logger(__name__)
+
+PUSH_JOURNAL_CACHE = "push_journal.jsonl"
+
+
+class PushJournal:
+    """
+    Journal of the batches pushed to Woo by an unfinished run.
+    Every batch is appended as soon as Woo answers it, with its sku range,
+    response status and the skus of the items Woo rejected. A run that died
+    halfway leaves the journal behind, and the next run skips every batch
+    whose exact payload Woo confirmed without rejecting any item. The
+    journal is cleared once a run pushes every batch.
+    """
+
+    def __init__(self, cache_connector):
+        self.cache_connector = cache_connector
+        entries = cache_connector.get_json_lines(PUSH_JOURNAL_CACHE)
+        self.confirmed = {
+            entry["batch_hash"] for entry in entries if entry["ok"]
+        }
+        if entries:
+            logger.info(
+                f"Resuming from a previous unfinished push, "
+                f"{len(self.confirmed)} of its {len(entries)} batches were "
+                f"confirmed."
+            )
+
+    def is_confirmed(self, batch_hash):
+        return batch_hash in self.confirmed
+
+    def record(self, verb, skus, batch_hash, ok, status_code, failed_skus=()):
+        self.cache_connector.append_json_line(
+            PUSH_JOURNAL_CACHE,
+            {
+                "verb": verb,
+                "first_sku": skus[0] if skus else None,
+                "last_sku": skus[-1] if skus else None,
+                "count": len(skus),
+                "batch_hash": batch_hash,
+                "ok": ok,
+                "status_code": status_code,
+                "failed_skus": list(failed_skus),
+            },
+        )
+        if ok:
+            self.confirmed.add(batch_hash)
+
+    def complete(self):
+        self.cache_connector.delete(PUSH_JOURNAL_CACHE)
+
+
+def hash_batch(verb, payloads):
+    content = json.dumps([verb, payloads], sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def get_accepted_skus(skus, items) -> list:
+    """
+    The skus of the batch items Woo accepted. Woo answers the items in the
+    order they were sent, and reports the failed ones as
+    `{"id": 0, "error": {...}}` within a 200 response.
+    """
+    accepted = [sku for sku, item in zip(skus, items) if "error" not in item]
+    if len(accepted) < len(skus):
+        errors = [item["error"] for item in items if "error" in item]
+        logger.error(
+            f"Woo rejected {len(skus) - len(accepted)} of the {len(skus)} "
+            f"products of a batch. "
+            f"First error: {errors[0] if errors else 'missing items'}"
+        )
+    return accepted
@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.logging.logger import get_module_logger
+from src.mappers.categories import CATEGORY_DICTIONARY
+
+logger = get_module_logger(__name__)
+
+CONTENT_HASHES_CACHE = "content_hashes.bin"
+CONTENT_METADATA_CACHE = "content_hashes.json"
+
+
+class ContentState:
+    """
+    Remembers a hash of the content fields (everything but price and stock)
+    last pushed to Woo for every sku.
+    Updates whose content did not change since then only need the light
+    `{id, regular_price, stock_quantity}` payload. A full content sync is
+    still forced every `full_sync_interval_hours`.
+    """
+
+    def __init__(self, cache_connector, config):
+        self.cache_connector = cache_connector
+        self.full_sync_interval_hours = config.get(
+            "full_sync_interval_hours", 24
+        )
+        self.metadata = cache_connector.get_json(
+            CONTENT_METADATA_CACHE, default={}
+        )
+        content = cache_connector.get_bytes(CONTENT_HASHES_CACHE)
+        pairs = np.frombuffer(content or b"", dtype=np.int64).reshape(-1, 2)
+        self.hashes = pd.Series(pairs[:, 1], index=pairs[:, 0])
+        self.pending = pd.Series(dtype=np.int64)
+        self.full_sync = False
+
+    def split(self, products_df: pd.DataFrame):
+        """
+        Splits the updates into (full_df, light_df).
+        """
+        hashes = hash_content(products_df)
+        self.pending = pd.Series(hashes, index=products_df["sku"].to_numpy())
+        hours_since_full_sync = (
+            time.time() - self.metadata.get("last_full_sync", 0)
+        ) / 3600
+        self.full_sync = hours_since_full_sync >= self.full_sync_interval_hours
+        if self.full_sync:
+            logger.info("Full content sync is due, sending every field.")
+            return products_df, products_df.iloc[0:0]
+        known_hashes = (
+            self.hashes[~self.hashes.index.duplicated()]
+            .reindex(products_df["sku"])
+            .to_numpy()
+        )
+        unchanged = known_hashes == hashes
+        return products_df[~unchanged], products_df[unchanged]
+
+    def commit(self, pushed_skus, all_pushed=True):
+        """
+        Stores the content hashes of the skus that Woo confirmed.
+        """
+        confirmed = self.pending[self.pending.index.isin(pushed_skus)]
+        hashes = pd.concat([self.hashes, confirmed])
+        self.hashes = hashes[~hashes.index.duplicated(keep="last")]
+        pairs = np.column_stack(
+            [self.hashes.index.to_numpy(np.int64), self.hashes.to_numpy()]
+        )
+        self.cache_connector.set_bytes(CONTENT_HASHES_CACHE, pairs.tobytes())
+        if self.full_sync and all_pushed:
+            self.metadata["last_full_sync"] = time.time()
+            self.cache_connector.set_json(
+                CONTENT_METADATA_CACHE, self.metadata
+            )
+
+
+def hash_content(products_df: pd.DataFrame) -> np.ndarray:
+    """
+    int64 hash per row of every field but price and stock.
+    Categories are hashed through their supplier keys, since their codes
+    are only stable within a run.
+    """
+    category_keys = {
+        codes: repr([CATEGORY_DICTIONARY.categories[code] for code in codes])
+        for codes in set(products_df["categories"])
+    }
+    content_df = pd.DataFrame(
+        {
+            "name": products_df["name"].astype(str),
+            "description": products_df["description"].astype(str),
+            "categories": [
+                category_keys[codes] for codes in products_df["categories"]
+            ],
+            "images": products_df["images"].astype(str),
+            "tags": products_df["tags"].astype(str),
+            "status": products_df["status"].astype(str),
+        }
+    )
+    hashes = pd.util.hash_pandas_object(content_df, index=False)
+    return hashes.to_numpy().view(np.int64)
@@ -0,0 +1,210 @@
+"""
+Fingerprint of the run inputs, checked before pandas, numpy, woocommerce or
+pysftp are imported so an unchanged run exits in milliseconds. The modules
+it imports stay free of them too.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src.connectors.cache_connector import CacheConnector
+from src.logging.logger import get_module_logger
+from src.sync.checkpoint import PUSH_JOURNAL_CACHE
+from src.sync.sources import SourceCache
+from src.sync.stores import get_stores
+
+logger = get_module_logger(__name__)
+
+FINGERPRINT_CACHE = "run_fingerprint.json"
+FINGERPRINT_CONFIG_FIELDS = [
+    "sources",
+    "tax",
+    "differential_price",
+    "defaults",
+    "strict_ean",
+    "skus_doc_url",
+    "skus_doc_sheet_name",
+    "stores",
+]
+
+
+def compute_run_fingerprint(config, cache_connector):
+    """
+    Cheap fingerprint of every input of a run: the remote validators of
+    each source, a hash of the SKU whitelist of every store and the config
+    fields that change the output.
+    Returns None when some input can not be validated cheaply, or there is
+    pending work from a previous run, in which case the run must go ahead.
+    """
+    stores = get_stores(config)
+    for store_name, _ in stores:
+        store_cache = (
+            CacheConnector(namespace=store_name)
+            if store_name
+            else cache_connector
+        )
+        if store_cache.get_bytes(PUSH_JOURNAL_CACHE) is not None:
+            return None
+
+    parts = {field: config.get(field) for field in FINGERPRINT_CONFIG_FIELDS}
+    sources = [
+        source for source in config.get("sources", []) if source.get("active")
+    ]
+    use_local = config.get("use_local", False)
+    source_cache = SourceCache(cache_connector=cache_connector, config=config)
+    with ThreadPoolExecutor(
+        max_workers=len(sources) + len(stores)
+    ) as executor:
+        whitelists = {
+            str(store_name): executor.submit(
+                _get_whitelist_hash, store_config, cache_connector
+            )
+            for store_name, store_config in stores
+        }
+        validators = {
+            source.get("name"): executor.submit(
+                _get_source_validator, source, use_local, source_cache
+            )
+            for source in sources
+        }
+        parts["whitelists"] = {
+            name: whitelist.result() for name, whitelist in whitelists.items()
+        }
+        parts["validators"] = {
+            name: validator.result() for name, validator in validators.items()
+        }
+
+    if (
+        None in parts["whitelists"].values()
+        or None in parts["validators"].values()
+    ):
+        return None
+    content = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def check_run(config, cache_connector):
+    """
+    Returns (skip, fingerprint) for a run with the given config.
+    Dry runs are never skipped, nor fingerprinted.
+    """
+    if config.get("dryrun", True):
+        return False, None
+    fingerprint = compute_run_fingerprint(
+        config=config, cache_connector=cache_connector
+    )
+    skip = is_unchanged(
+        config=config, cache_connector=cache_connector, fingerprint=fingerprint
+    )
+    return skip, fingerprint
+
+
+def is_unchanged(config, cache_connector, fingerprint):
+    """
+    Whether the fingerprint matches the last successful run, and that run
+    is recent enough. A run is forced every `fingerprint_max_age_minutes`
+    regardless, to pick up changes made on the Woo side.
+    """
+    if not fingerprint:
+        return False
+    last_run = cache_connector.get_json(FINGERPRINT_CACHE, default={})
+    max_age = config.get("fingerprint_max_age_minutes", 60) * 60
+    return (
+        last_run.get("fingerprint") == fingerprint
+        and time.time() - last_run.get("saved_at", 0) < max_age
+    )
+
+
+def save_run_fingerprint(cache_connector, fingerprint):
+    cache_connector.set_json(
+        FINGERPRINT_CACHE,
+        {"fingerprint": fingerprint, "saved_at": time.time()},
+    )
+
+
+def _get_whitelist_hash(config, cache_connector):
+    """
+    Hash of the whitelist sheet. It is reused for `skus_cache_ttl` seconds,
+    as long as the run itself reuses its cached whitelist, and revalidated
+    with a conditional request after that.
+    """
+    doc_url = config.get("skus_doc_url")
+    sheet_name = config.get("skus_doc_sheet_name", "").replace(" ", "%20")
+    csv_url = f"{doc_url}/export?gid=0&format=csv&sheet={sheet_name}"
+    url_hash = hashlib.sha1(csv_url.encode("utf-8")).hexdigest()[:12]
+    cache_file = f"whitelist_{url_hash}.json"
+    cached = cache_connector.get_json(cache_file, default={})
+    ttl = config.get("skus_cache_ttl", 3600)
+    if cached and time.time() - cached["checked_at"] < ttl:
+        return cached["hash"]
+
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        req = requests.get(csv_url, headers=headers, timeout=10)
+        if req.status_code == 304 and cached:
+            whitelist_hash = cached["hash"]
+        else:
+            req.raise_for_status()
+            whitelist_hash = hashlib.sha1(req.content).hexdigest()
+    except requests.RequestException as error:
+        logger.info(f"Could not fingerprint the SKU whitelist. {error}")
+        return None
+    cache_connector.set_json(
+        cache_file,
+        {
+            "hash": whitelist_hash,
+            "etag": req.headers.get("ETag", cached.get("etag")),
+            "last_modified": req.headers.get(
+                "Last-Modified", cached.get("last_modified")
+            ),
+            "checked_at": time.time(),
+        },
+    )
+    return whitelist_hash
+
+
+def _get_source_validator(source, use_local, source_cache):
+    source_name = source.get("name")
+    if not source_cache.is_due(source):
+        # The run reuses its cached products, no need to look at the source.
+        return ["cached", source_cache.get_state(source_name)["refreshed_at"]]
+    try:
+        if use_local or source.get("use_local", False):
+            stat = os.stat(f"tmp/{source_name}.csv")
+            return [stat.st_mtime, stat.st_size]
+        if source.get("type") == "endpoint":
+            req = requests.head(
+                source.get("download_url"), allow_redirects=True, timeout=10
+            )
+            validator = [
+                req.headers.get("ETag"),
+                req.headers.get("Last-Modified"),
+            ]
+            if req.ok and any(validator):
+                return validator + [req.headers.get("Content-Length")]
+        elif source.get("type") == "ftp":
+            # Only imported when an ftp source is active, it is heavy.
+            from pysftp import CnOpts, Connection
+
+            cnopts = CnOpts()
+            cnopts.hostkeys = None
+            with Connection(
+                source.get("download_url"),
+                username=source.get("user"),
+                password=source.get("password"),
+                cnopts=cnopts,
+            ) as sftp:
+                stat = sftp.stat(source.get("file_path"))
+            return [stat.st_mtime, stat.st_size]
+    except Exception as error:
+        logger.info(f"Could not fingerprint source {source_name}. {error}")
+    return None
@@ -0,0 +1,86 @@
+import hashlib
+
+import pandas as pd
+
+from src.logging.logger import get_module_logger
+from src.skus import INVALID_SKU, normalize_skus
+
+logger = get_module_logger(__name__)
+
+IMAGES_CACHE = "image_fingerprints.json"
+
+
+class ImageState:
+    """
+    Remembers the fingerprint of the images last pushed to Woo for every
+    sku, and the Woo media id every image url was sideloaded into.
+    Woo re-fetches and re-processes every image it receives, so updates
+    leave `images` out when the fingerprint did not change, and images that
+    were already sideloaded are referenced by their media id instead.
+    """
+
+    def __init__(self, cache_connector, file_connector, config):
+        self.cache_connector = cache_connector
+        self.file_connector = file_connector
+        self.use_etags = config.get("image_etags", False)
+        state = cache_connector.get_json(IMAGES_CACHE, default={})
+        self.fingerprints = state.get("fingerprints", {})
+        self.media_ids = state.get("media_ids", {})
+        self.pending = {}
+
+    def apply(self, payloads, verb="update"):
+        """
+        Rewrites the `images` of the given payloads in place.
+        """
+        for payload in payloads:
+            images = payload.get("images")
+            if not images:
+                continue
+            sku = str(payload["sku"])
+            urls = [image["src"] for image in images]
+            fingerprint = self._fingerprint(urls)
+            self.pending[sku] = (fingerprint, urls)
+            if verb == "update" and self.fingerprints.get(sku) == fingerprint:
+                del payload["images"]
+            elif all(url in self.media_ids for url in urls):
+                payload["images"] = [
+                    {"id": self.media_ids[url]} for url in urls
+                ]
+        return payloads
+
+    def record(self, verb, response):
+        """
+        Stores the fingerprints and media ids Woo confirmed in a batch
+        response.
+        """
+        products = response.get(verb, [])
+        skus = normalize_skus(
+            pd.Series([product.get("sku", "") for product in products])
+        )
+        for sku, product in zip(skus, products):
+            if sku == INVALID_SKU or "error" in product:
+                continue
+            pending = self.pending.pop(str(sku), None)
+            if pending is None:
+                continue
+            fingerprint, urls = pending
+            self.fingerprints[str(sku)] = fingerprint
+            media_ids = [
+                image.get("id") for image in product.get("images", [])
+            ]
+            if len(media_ids) == len(urls) and all(media_ids):
+                self.media_ids.update(zip(urls, media_ids))
+
+    def save(self):
+        self.cache_connector.set_json(
+            IMAGES_CACHE,
+            {"fingerprints": self.fingerprints, "media_ids": self.media_ids},
+        )
+
+    def _fingerprint(self, urls):
+        parts = list(urls)
+        if self.use_etags:
+            parts.extend(
+                self.file_connector.get_etag(url) or "" for url in urls
+            )
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
@@ -0,0 +1,43 @@
+import numpy as np
+
+SHARDS_CACHE_FOLDER = "shards"
+SHARD_RUN_CACHE = f"{SHARDS_CACHE_FOLDER}/run.json"
+# Fibonacci hashing multiplier, spreads consecutive EANs across the shards.
+SHARD_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def parse_shard(value) -> tuple:
+    """
+    Parses an `index/count` shard argument, such as `2/4`.
+    """
+    index, count = (int(part) for part in value.split("/"))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value}, expected index/count.")
+    return index, count
+
+
+def in_shard(skus, shard) -> np.ndarray:
+    """
+    Boolean mask of the int64 skus that belong to the shard. The hash only
+    depends on the sku, so every worker and host agree on the partition.
+    """
+    index, count = shard
+    skus = np.asarray(skus, dtype=np.int64).astype(np.uint64)
+    hashes = (skus * SHARD_HASH_MULTIPLIER) >> np.uint64(32)
+    return hashes % np.uint64(count) == np.uint64(index)
+
+
+def get_shard_namespace(store_name, shard=None):
+    """
+    Cache namespace of a store within a shard, so concurrent workers never
+    share their content hashes, image fingerprints or push journal.
+    """
+    if shard is None:
+        return store_name
+    index, count = shard
+    return f"{store_name or 'default'}/shard_{index}_of_{count}"
+
+
+def get_shard_report_cache(shard):
+    index, count = shard
+    return f"{SHARDS_CACHE_FOLDER}/report_{index}_of_{count}.json"
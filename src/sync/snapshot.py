@@ -0,0 +1,226 @@
+"""
+Indexed sqlite snapshot of every merge. Free of pandas and numpy, so the
+lookups answer in milliseconds; the writer only calls DataFrame methods.
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+SNAPSHOT_FOLDER = "snapshot"
+SNAPSHOT_SCHEMA = """
+CREATE TABLE snapshot (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE candidates (
+    sku INTEGER,
+    source TEXT,
+    source_order INTEGER,
+    regular_price REAL,
+    applied_tax REAL,
+    stock INTEGER,
+    name TEXT,
+    PRIMARY KEY (sku, source)
+) WITHOUT ROWID;
+CREATE TABLE products (
+    sku INTEGER PRIMARY KEY,
+    price_source TEXT,
+    base_price REAL,
+    regular_price REAL,
+    stock INTEGER,
+    name TEXT
+);
+CREATE TABLE store_prices (
+    sku INTEGER,
+    store TEXT,
+    regular_price REAL,
+    PRIMARY KEY (sku, store)
+) WITHOUT ROWID;
+"""
+CANDIDATE_COLUMNS = [
+    "sku",
+    "source",
+    "source_order",
+    "regular_price",
+    "applied_tax",
+    "stock",
+    "name",
+]
+PRODUCT_COLUMNS = [
+    "sku",
+    "price_source",
+    "base_price",
+    "regular_price",
+    "stock",
+    "name",
+]
+SNAPSHOT_MANIFEST = f"{SNAPSHOT_FOLDER}/manifest.json"
+LOOKUP_CHUNK_SIZE = 500
+
+
+def get_snapshot_name(shard=None):
+    if shard is None:
+        return "snapshot"
+    index, count = shard
+    return f"shard_{index}_of_{count}"
+
+
+def set_snapshot_layout(cache_connector, names):
+    """
+    Records the snapshot files of the current run layout, a single snapshot
+    or one per shard, and removes the ones left by any other layout so
+    lookups never answer from a stale merge.
+    """
+    files = [f"{name}.sqlite" for name in names]
+    cache_connector.set_json(SNAPSHOT_MANIFEST, {"files": files})
+    for path in glob.glob(
+        cache_connector.get_path(f"{SNAPSHOT_FOLDER}/*.sqlite")
+    ):
+        if os.path.basename(path) not in files:
+            os.remove(path)
+
+
+def write_snapshot(
+    cache_connector, name, candidates_df, products_df, store_prices
+):
+    """
+    Writes the merge of a run into an indexed sqlite file: every candidate
+    offer per sku, the winning source with its price before and after the
+    markup, and the price of every store.
+    store_prices maps each store name to its regular_price Series, indexed
+    like products_df. The file is replaced atomically.
+    """
+    path = cache_connector.get_path(f"{SNAPSHOT_FOLDER}/{name}.sqlite")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with closing(sqlite3.connect(tmp_path)) as connection:
+        connection.executescript(SNAPSHOT_SCHEMA)
+        connection.executemany(
+            "INSERT INTO snapshot VALUES (?, ?)",
+            [
+                ("merged_at", json.dumps(time.time())),
+                (
+                    "sources",
+                    json.dumps(
+                        candidates_df["source"].drop_duplicates().tolist()
+                    ),
+                ),
+            ],
+        )
+        connection.executemany(
+            "INSERT INTO candidates VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _to_rows(candidates_df[CANDIDATE_COLUMNS]),
+        )
+        connection.executemany(
+            "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?)",
+            _to_rows(products_df[PRODUCT_COLUMNS]),
+        )
+        for store_name, prices in store_prices.items():
+            connection.executemany(
+                "INSERT INTO store_prices VALUES (?, ?, ?)",
+                [
+                    [sku, store_name, price]
+                    for sku, price in zip(
+                        _to_rows(products_df["sku"]), _to_rows(prices)
+                    )
+                ],
+            )
+        connection.commit()
+    os.replace(tmp_path, path)
+
+
+def _to_rows(data):
+    # Goes through JSON to get plain Python values out of numpy ones.
+    return json.loads(data.to_json(orient="values"))
+
+
+class SnapshotReader:
+    """
+    Answers per sku lookups over the snapshots left by the last merges.
+    Sharded runs leave one snapshot per shard; every file of the current
+    layout manifest is looked at and the most recent merge of each sku wins.
+    """
+
+    def __init__(self, cache_connector):
+        manifest = cache_connector.get_json(SNAPSHOT_MANIFEST, default={})
+        self.paths = [
+            path
+            for path in (
+                cache_connector.get_path(f"{SNAPSHOT_FOLDER}/{name}")
+                for name in manifest.get("files", [])
+            )
+            if os.path.exists(path)
+        ]
+
+    def lookup(self, skus) -> dict:
+        """
+        Returns the snapshot record of every sku found, keyed by sku.
+        """
+        skus = list(dict.fromkeys(skus))
+        records = {}
+        for path in self.paths:
+            with closing(self._connect(path)) as connection:
+                merged_at = self._get_meta(connection, "merged_at")
+                for start in range(0, len(skus), LOOKUP_CHUNK_SIZE):
+                    chunk = skus[start : start + LOOKUP_CHUNK_SIZE]
+                    for record in self._lookup_chunk(connection, chunk):
+                        record["merged_at"] = merged_at
+                        known = records.get(record["sku"])
+                        if known is None or known["merged_at"] < merged_at:
+                            records[record["sku"]] = record
+        return records
+
+    def summary(self) -> dict:
+        """
+        Products won by every source, per snapshot file.
+        """
+        summary = {}
+        for path in self.paths:
+            with closing(self._connect(path)) as connection:
+                summary[os.path.basename(path)] = {
+                    "merged_at": self._get_meta(connection, "merged_at"),
+                    "wins": dict(
+                        connection.execute(
+                            "SELECT price_source, COUNT(*) FROM products "
+                            "GROUP BY price_source ORDER BY 2 DESC"
+                        ).fetchall()
+                    ),
+                }
+        return summary
+
+    def _lookup_chunk(self, connection, skus):
+        placeholders = ", ".join("?" * len(skus))
+        records = {
+            row["sku"]: dict(row, candidates=[], store_prices={})
+            for row in connection.execute(
+                f"SELECT * FROM products WHERE sku IN ({placeholders})", skus
+            )
+        }
+        for row in connection.execute(
+            f"SELECT * FROM candidates WHERE sku IN ({placeholders}) "
+            f"ORDER BY sku, regular_price, source_order",
+            skus,
+        ):
+            candidate = dict(row)
+            records[candidate.pop("sku")]["candidates"].append(candidate)
+        for row in connection.execute(
+            f"SELECT * FROM store_prices WHERE sku IN ({placeholders})", skus
+        ):
+            records[row["sku"]]["store_prices"][row["store"]] = row[
+                "regular_price"
+            ]
+        return records.values()
+
+    def _connect(self, path):
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _get_meta(self, connection, key):
+        row = connection.execute(
+            "SELECT value FROM snapshot WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row["value"]) if row else None
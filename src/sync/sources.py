@@ -0,0 +1,72 @@
+import json
+import pickle
+import time
+
+from src.logging.logger import get_module_logger
+
+logger = get_module_logger(__name__)
+
+PARSE_KEY_FIELDS = ["tax", "strict_ean"]
+
+
+class SourceCache:
+    """
+    On disk copy of the last mapped products of every source.
+    Sources with a `refresh_interval_minutes` are only downloaded and parsed
+    once it elapsed; until then the run reuses their last mapped products.
+    The mapped products depend on the PARSE_KEY_FIELDS settings too, a
+    source cached with other values is due right away.
+    Every source keeps its state in its own file, only ever written whole,
+    so processes sharing the cache folder never overwrite each other.
+    """
+
+    def __init__(self, cache_connector, config=None):
+        self.cache_connector = cache_connector
+        self.parse_key = json.dumps(
+            [(config or {}).get(field) for field in PARSE_KEY_FIELDS]
+        )
+
+    def get_state(self, source_name):
+        return self.cache_connector.get_json(
+            f"source_{source_name}.json", default={}
+        )
+
+    def is_due(self, source):
+        state = self.get_state(source.get("name"))
+        if state.get("parse_key") != self.parse_key:
+            return True
+        interval = source.get("refresh_interval_minutes", 0) * 60
+        return time.time() - state.get("refreshed_at", 0) >= interval
+
+    def get(self, source_name):
+        from src.mappers.categories import CATEGORY_DICTIONARY
+
+        content = self.cache_connector.get_bytes(f"source_{source_name}.pkl")
+        if content is None:
+            return None
+        try:
+            products_df, category_keys = pickle.loads(content)
+        except Exception as error:
+            logger.warning(
+                f"Cached {source_name} products are unusable. {error}"
+            )
+            return None
+        products_df["categories"] = CATEGORY_DICTIONARY.import_codes(
+            products_df["categories"], category_keys
+        )
+        return products_df
+
+    def set(self, source_name, products_df):
+        from src.mappers.categories import CATEGORY_DICTIONARY
+
+        category_keys = CATEGORY_DICTIONARY.export_keys(
+            products_df["categories"]
+        )
+        self.cache_connector.set_bytes(
+            f"source_{source_name}.pkl",
+            pickle.dumps((products_df, category_keys)),
+        )
+        self.cache_connector.set_json(
+            f"source_{source_name}.json",
+            {"refreshed_at": time.time(), "parse_key": self.parse_key},
+        )
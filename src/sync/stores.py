@@ -0,0 +1,51 @@
+import os
+
+DEFAULT_BOT_TAG_ID = 790
+STORE_CREDENTIALS = {
+    "url": "url_env",
+    "consumer_key": "key_id_env",
+    "consumer_secret": "key_env",
+}
+
+
+def get_stores(config) -> list:
+    """
+    The Woo stores a run pushes into, as (name, store_config) pairs.
+    Without active `stores`, the single store from the environment settings,
+    named None so its caches stay where they always were.
+    A store config is the run config with the store entry on top, so a
+    store only lists what it overrides: `tax`, `differential_price`,
+    `skus_doc_url`, `skus_doc_sheet_name`, `bot_tag_id`...
+    """
+    stores = [
+        store
+        for store in config.get("stores") or []
+        if store.get("active", True)
+    ]
+    if not stores:
+        return [(None, config)]
+    return [(store["name"], {**config, **store}) for store in stores]
+
+
+def get_store_credentials(store_name, store_config) -> dict:
+    """
+    Woo credentials of a store, read from the environment variables named
+    by its `url_env`, `key_id_env` and `key_env`.
+    The default store keeps using WCAPI_URL, ACCESS_KEY_ID and ACCESS_KEY.
+    """
+    if store_name is None:
+        return {}
+    credentials = {
+        argument: os.getenv(store_config.get(setting) or "")
+        for argument, setting in STORE_CREDENTIALS.items()
+    }
+    missing = [
+        STORE_CREDENTIALS[argument]
+        for argument, value in credentials.items()
+        if not value
+    ]
+    if missing:
+        raise ValueError(
+            f"Store {store_name} is missing the credentials in: {missing}"
+        )
+    return credentials
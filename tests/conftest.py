@@ -0,0 +1,5 @@
+import os
+
+# The logger needs these at import time, set them before any src import.
+os.environ.setdefault("LOG_LEVEL", "INFO")
+os.environ.setdefault("LOG_FILE_NAME", os.devnull)
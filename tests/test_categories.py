@@ -0,0 +1,17 @@
+from src.mappers.categories import CategoryDictionary
+
+
+def test_decode_only_sends_resolved_woo_ids():
+    category_dictionary = CategoryDictionary()
+    resolved = category_dictionary.get_code("mcr", 12, "Portátiles")
+    unresolved = category_dictionary.get_code("mcr", 13, "Monitores")
+    name_only = category_dictionary.get_code("bts", None, "Ratones")
+    assert category_dictionary.decode(
+        (resolved, unresolved, name_only), woo_ids={resolved: 501}
+    ) == [{"id": 501}, {"name": "Monitores"}, {"name": "Ratones"}]
+
+
+def test_decode_skips_unnamed_categories():
+    category_dictionary = CategoryDictionary()
+    code = category_dictionary.get_code("megasur", 7, None)
+    assert category_dictionary.decode((code,), woo_ids={code: 501}) == []
@@ -0,0 +1,18 @@
+from src.sync.checkpoint import get_accepted_skus
+
+
+def test_accepted_skus_skip_failed_items():
+    items = [
+        {"id": 77, "sku": "4006381333931"},
+        {"id": 0, "error": {"code": "woocommerce_rest_invalid_id"}},
+        {"id": 78, "sku": "5901234123457"},
+    ]
+    assert get_accepted_skus(
+        [4006381333931, 12345678905, 5901234123457], items
+    ) == [4006381333931, 5901234123457]
+
+
+def test_accepted_skus_missing_items():
+    assert get_accepted_skus([4006381333931, 12345678905], [{"id": 77}]) == [
+        4006381333931
+    ]
@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+# The puller imports the Woo and SFTP clients.
+pytest.importorskip("pysftp")
+pytest.importorskip("woocommerce")
+
+from src.puller import (  # noqa: E402
+    _apply_differential_price,
+    get_candidates,
+    merge_sources,
+)
+
+
+def get_source_df(skus, prices, name, **columns):
+    return pd.DataFrame(
+        {
+            "sku": skus,
+            "name": [f"{name} {sku}" for sku in skus],
+            "description": [f"{name} description" for _ in skus],
+            "stock": [5] * len(skus),
+            "categories": [()] * len(skus),
+            "regular_price": prices,
+            "images": [f"https://{name}/{sku}.jpg" for sku in skus],
+            "applied_tax": [1.21] * len(skus),
+            **columns,
+        }
+    )
+
+
+def merge(all_data_sources, **config):
+    return merge_sources(get_candidates(all_data_sources), config).set_index(
+        "sku"
+    )
+
+
+def test_cheapest_source_wins_ties_as_last_configured():
+    merged_df = merge(
+        {
+            "megasur": get_source_df([1, 2], [10.0, 7.0], "megasur"),
+            "mcr": get_source_df([1, 2], [10.0, 8.0], "mcr"),
+            "bts": get_source_df([1], [12.0], "bts"),
+        }
+    )
+    assert merged_df.loc[1, "price_source"] == "mcr"
+    assert merged_df.loc[1, "base_price"] == 10.0
+    assert merged_df.loc[2, "price_source"] == "megasur"
+    assert merged_df.loc[2, "regular_price"] == 7.0
+
+
+def test_defaults_priorities():
+    merged_df = merge(
+        {
+            "megasur": get_source_df([1, 2], [10.0, 10.0], "megasur"),
+            "mcr": get_source_df(
+                [1, 2], [9.0, 9.0], "mcr", images=["", "https://mcr/2.jpg"]
+            ),
+        },
+        defaults={
+            "name": ["mcr", "source"],
+            "description": ["megasur"],
+            "images": ["mcr", "megasur"],
+        },
+    )
+    assert merged_df["name"].tolist() == ["mcr 1", "mcr 2"]
+    assert merged_df["description"].tolist() == [
+        "megasur description",
+        "megasur description",
+    ]
+    # mcr has no image for sku 1, the next source in the priorities does.
+    assert merged_df["images"].tolist() == [
+        "https://megasur/1.jpg",
+        "https://mcr/2.jpg",
+    ]
+
+
+def test_defaults_fall_back_to_configured_order():
+    merged_df = merge(
+        {
+            "megasur": get_source_df([1], [10.0], "megasur"),
+            "mcr": get_source_df([1], [9.0], "mcr"),
+        }
+    )
+    assert merged_df.loc[1, "name"] == "megasur 1"
+
+
+def test_differential_price_buckets():
+    prices = pd.Series([5.0, 10.0, 10.5, 100.0, 1000.0])
+    final_prices = _apply_differential_price(
+        prices, {"10": 1.5, "100": 1.2, "inf": 1.1}
+    )
+    assert final_prices.round(4).tolist() == [7.5, 15.0, 12.6, 120.0, 1100.0]
+
+
+def test_differential_price_without_buckets():
+    prices = pd.Series([5.0, 10.0])
+    assert _apply_differential_price(prices, {}).tolist() == [5.0, 10.0]
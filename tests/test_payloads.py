@@ -0,0 +1,32 @@
+import pandas as pd
+
+from src.mappers.payloads import build_light_payloads, build_payloads
+
+
+def get_products_df():
+    return pd.DataFrame(
+        {
+            "id": [77],
+            "sku": [4006381333931],
+            "name": ["Product"],
+            "stock": [8],
+            "regular_price": [12.5],
+            "categories": [()],
+            "images": pd.Series(["https://img/1.jpg"], dtype="category"),
+        }
+    )
+
+
+def test_payloads_send_stock_quantity():
+    products_df = get_products_df()
+    for payload in build_payloads(products_df) + build_light_payloads(
+        products_df
+    ):
+        assert payload["stock_quantity"] == 8
+        assert payload["manage_stock"] is True
+        assert "stock" not in payload
+
+
+def test_payloads_images():
+    payload = build_payloads(get_products_df())[0]
+    assert payload["images"] == [{"src": "https://img/1.jpg"}]
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from src.skus import INVALID_SKU, has_valid_checksum, normalize_skus
+
+
+def test_normalize_skus_strings():
+    skus = pd.Series(
+        ["4006381333931.0", " 0036000291452 ", "036000291452", "abc", ""]
+    )
+    assert normalize_skus(skus).tolist() == [
+        4006381333931,
+        36000291452,
+        36000291452,
+        INVALID_SKU,
+        INVALID_SKU,
+    ]
+
+
+def test_normalize_skus_floats():
+    skus = pd.Series([4006381333931.0, 73513537.0, np.nan])
+    assert normalize_skus(skus).tolist() == [
+        4006381333931,
+        73513537,
+        INVALID_SKU,
+    ]
+
+
+def test_normalize_skus_rejects_zero():
+    assert normalize_skus(pd.Series(["00000000", "0.0"])).tolist() == [
+        INVALID_SKU,
+        INVALID_SKU,
+    ]
+    assert normalize_skus(pd.Series([0, 73513537])).tolist() == [
+        INVALID_SKU,
+        73513537,
+    ]
+
+
+def test_has_valid_checksum():
+    # EAN-8, UPC-12 and EAN-13, good and with a wrong check digit.
+    skus = normalize_skus(
+        pd.Series(
+            [
+                "73513537",
+                "73513538",
+                "036000291452",
+                "036000291453",
+                "4006381333931",
+                "4006381333932",
+            ]
+        )
+    )
+    assert has_valid_checksum(skus).tolist() == [
+        True,
+        False,
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_has_valid_checksum_invalid_skus():
+    skus = pd.Series([INVALID_SKU, 10**14 + 3], dtype=np.int64)
+    assert not has_valid_checksum(skus).any()